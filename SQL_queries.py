@@ -1,46 +1,103 @@
 # SQL_QUERIES.py
 # file that contains all relevant SQL queries to pull satellite parts
 
+import itertools
+import threading
+
 import pandas as pd
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-import build_tree as bt
-import output_tables as ot
+import pn_wo_map as pwm
+import instrumentation as instr
 
 
-# call function first to establish connection with server - pass returned engine to other functions
-def connect_to_sql_server():
-    DATABASE_USERNAME = "satrel" 
+DATABASE_USERNAME = "satrel"
+DATABASE_URI = 'mssql+pyodbc://'+DATABASE_USERNAME
+
+# connection pool of the shared engine, sized for the pull and tree workers - change as necessary
+POOL_SIZE = 8
+MAX_OVERFLOW = 4
+POOL_RECYCLE = 3600 # seconds before a pooled connection is replaced
+
+# log every statement sent to the server - change as necessary
+ECHO = False
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+# return the engine shared by the whole process for a database, creating it the first time; engines are thread safe,
+# each query checks a connection out of the pool and pre-ping replaces connections the server has dropped
+def get_engine(uri=DATABASE_URI, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_recycle=POOL_RECYCLE, echo=ECHO):
+    key = (uri, pool_size, max_overflow, pool_recycle, echo)
+    with _engines_lock:
+        if key not in _engines:
+            dialect_options = {'use_setinputsizes': False} if uri.startswith('mssql') else {} # pyodbc only option
+            _engines[key] = create_engine(uri, pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=True,
+                                          pool_recycle=pool_recycle, echo=echo, **dialect_options)
+        return _engines[key]
 
-    app = Flask(__name__)
 
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'mssql+pyodbc://'+DATABASE_USERNAME
-    app.config['SQLALCHEMY_ECHO'] = True
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    db = SQLAlchemy(app)
+# close the pooled connections of every shared engine
+def dispose_engines():
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
 
-    # check if the connection is successfully established or not and if yes return an engine object
-    with app.app_context():
-        try:
-            engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], use_setinputsizes=False)
-            return engine, db
-        except Exception as e:
-            return None
+
+# call function first to establish connection with server - pass returned engine to other functions
+# returns (engine, None), the second value is where the Flask-SQLAlchemy object used to be
+def connect_to_sql_server(echo=ECHO):
+    return get_engine(echo=echo), None
+
+
+# column types of the genealogy queries, so every streamed chunk has the same dtypes
+GENEALOGY_DTYPES = {'ChildTraceID': 'int64', 'ParentTraceID': 'int64'}
 
 
 # run specific warp query with string input
-def run_warp_query(engine, sql_query, *params):
-    sql_df = pd.read_sql(sql = sql_query, con = engine, params = params)   
+# with chunksize given, return an iterator of dataframes of at most chunksize rows instead of one dataframe
+def run_warp_query(engine, sql_query, *params, chunksize=None, dtype=None):
+    if chunksize is not None:
+        return run_warp_query_chunks(engine, sql_query, *params, chunksize=chunksize, dtype=dtype)
+    sql_df = pd.read_sql(sql = sql_query, con = engine, params = params, dtype = dtype)   
+    instr.count(sql_rows=len(sql_df))
     return sql_df
 
 
-def get_satpart_children(engine, part_sn, part_pn_like=['%'], child_pn_like=['%']):
+# yield the result of a warp query in chunks; the rows are streamed from the server so the driver holds one chunk at a time
+# (a caller that collects the chunks still holds what it keeps of them)
+def run_warp_query_chunks(engine, sql_query, *params, chunksize=50_000, dtype=None):
+    if isinstance(engine, Engine):
+        with engine.connect().execution_options(stream_results=True) as con:
+            for chunk in pd.read_sql(sql = sql_query, con = con, params = params, chunksize = chunksize, dtype = dtype):
+                instr.count(sql_rows=len(chunk))
+                yield chunk
+    else: # DBAPI connection, e.g. a sqlite stand-in
+        for chunk in pd.read_sql(sql = sql_query, con = engine, params = params, chunksize = chunksize, dtype = dtype):
+            instr.count(sql_rows=len(chunk))
+            yield chunk
+
+
+# table names used by the genealogy queries - a stand-in database (e.g. the SQLite genealogy mirror) can pass its own names
+ERP_TABLES = {
+    'GenealogyTraceDetail': 'SpacexERP.trc.GenealogyTraceDetail',
+    'Trace': 'SpacexERP.trc.Trace',
+    'Part': 'SpacexERP.inv.Part',
+    'Requirement': 'SpacexERP.sfc.Requirement',
+    'WorkOrder': 'SpacexERP.sfc.WorkOrder',
+    'Operation': 'SpacexERP.sfc.Operation',
+}
+
+
+def get_satpart_children(engine, part_sn, part_pn_like=['%'], child_pn_like=['%'], tables=ERP_TABLES):
     # get as-built children of the given part in warp
     # part_pn_like should be a list of strings that the part PN can be LIKE.
     # child_pn_like should be a list of strings that the child PN can be LIKE.
+    # the patterns are bound parameters, so the statement (and its plan) only changes with the number of patterns
     
     results = run_warp_query(engine,
         f"""
@@ -48,20 +105,20 @@ def get_satpart_children(engine, part_sn, part_pn_like=['%'], child_pn_like=['%'
                 SELECT 
                     ChildTraceID, 
                     ParentTraceID
-                FROM SpacexERP.trc.GenealogyTraceDetail RootGenealogy
-                INNER JOIN SpacexERP.trc.Trace as RootTrace 
+                FROM {tables['GenealogyTraceDetail']} RootGenealogy
+                INNER JOIN {tables['Trace']} as RootTrace 
                     ON RootGenealogy.ParentTraceID = RootTrace.TraceID
                     AND RootTrace.SerialNumber = ?
-                INNER JOIN SpacexERP.inv.Part AS RootPart ON RootPart.PartID = RootTrace.PartID
+                INNER JOIN {tables['Part']} AS RootPart ON RootPart.PartID = RootTrace.PartID
                     AND (
-                        {' OR '.join(["RootPart.PartNumber LIKE '" + pn + "'" for pn in part_pn_like])}
+                        {' OR '.join(['RootPart.PartNumber LIKE ?'] * len(part_pn_like))}
                     )
                 UNION ALL
 
                 SELECT 
                     child.ChildTraceID, 
                     child.ParentTraceID
-                FROM SpacexERP.trc.GenealogyTraceDetail child
+                FROM {tables['GenealogyTraceDetail']} child
                 INNER JOIN genealogy_parent_cte parent
                     ON parent.ChildTraceID = child.ParentTraceID
             )
@@ -83,45 +140,46 @@ def get_satpart_children(engine, part_sn, part_pn_like=['%'], child_pn_like=['%'
                    ELSE 'Unknown'
                 END AS [Status]
             FROM genealogy_parent_cte all_parent
-                JOIN SpacexERP.trc.Trace AS ParentTrace ON ParentTrace.TraceID = all_parent.ParentTraceID
-                JOIN SpacexERP.inv.Part AS ParentPart ON ParentPart.PartID = ParentTrace.PartID
-                JOIN SpacexERP.trc.Trace AS ChildTrace ON ChildTrace.TraceID = all_parent.ChildTraceID
-                JOIN SpacexERP.inv.Part AS ChildPart ON ChildPart.PartID = ChildTrace.PartID
-                LEFT JOIN SpacexERP.trc.GenealogyTraceDetail t ON t.ChildTraceID = ChildTrace.TraceID AND t.ParentTraceID = ParentTrace.TraceID
-                LEFT JOIN SpacexERP.sfc.Requirement r ON r.RequirementID = t.RequirementID and r.PartID = ChildPart.PartID
-                LEFT JOIN SpacexERP.sfc.WorkOrder wo ON wo.WorkOrderID = r.WorkOrderID
-                LEFT JOIN SpacexERP.sfc.Operation op ON op.WorkOrderID = wo.WorkOrderID
-                LEFT JOIN SpacexERP.trc.Trace t2 ON t2.LotCode = CONCAT('WO',wo.BaseID)
-                LEFT JOIN SpacexERP.sfc.Requirement r2 ON r2.OperationID = op.OperationID and r2.PartID = ChildPart.PartID
-
-            WHERE {' OR '.join(["ChildPart.PartNumber LIKE '" + pn + "'" for pn in child_pn_like])}
+                JOIN {tables['Trace']} AS ParentTrace ON ParentTrace.TraceID = all_parent.ParentTraceID
+                JOIN {tables['Part']} AS ParentPart ON ParentPart.PartID = ParentTrace.PartID
+                JOIN {tables['Trace']} AS ChildTrace ON ChildTrace.TraceID = all_parent.ChildTraceID
+                JOIN {tables['Part']} AS ChildPart ON ChildPart.PartID = ChildTrace.PartID
+                LEFT JOIN {tables['GenealogyTraceDetail']} t ON t.ChildTraceID = ChildTrace.TraceID AND t.ParentTraceID = ParentTrace.TraceID
+                LEFT JOIN {tables['Requirement']} r ON r.RequirementID = t.RequirementID and r.PartID = ChildPart.PartID
+                LEFT JOIN {tables['WorkOrder']} wo ON wo.WorkOrderID = r.WorkOrderID
+                LEFT JOIN {tables['Operation']} op ON op.WorkOrderID = wo.WorkOrderID
+                LEFT JOIN {tables['Trace']} t2 ON t2.LotCode = CONCAT('WO',wo.BaseID)
+                LEFT JOIN {tables['Requirement']} r2 ON r2.OperationID = op.OperationID and r2.PartID = ChildPart.PartID
+
+            WHERE {' OR '.join(['ChildPart.PartNumber LIKE ?'] * len(child_pn_like))}
             AND r2.RequirementID is not NULL
         """,
-        part_sn
+        part_sn, *part_pn_like, *child_pn_like
     )
     return results
 
 
 # returns a subtree of the full tree outputted from get_satpart_children where the leaves only correspond to magnets
-def get_full_magnets_tree(engine, sn):
+# with chunksize given, the rows are returned as an iterator of chunks (see run_warp_query_chunks)
+def get_full_magnets_tree(engine, sn, chunksize=None, tables=ERP_TABLES):
     results = run_warp_query(engine,
         f"""
             WITH genealogy_parent_cte AS (
                 SELECT 
                     ChildTraceID, 
                     ParentTraceID
-                FROM SpacexERP.trc.GenealogyTraceDetail RootGenealogy
-                INNER JOIN SpacexERP.trc.Trace as RootTrace 
+                FROM {tables['GenealogyTraceDetail']} RootGenealogy
+                INNER JOIN {tables['Trace']} as RootTrace 
                     ON RootGenealogy.ParentTraceID = RootTrace.TraceID
                     AND RootTrace.SerialNumber = ?
-                    INNER JOIN SpacexERP.inv.Part AS RootPart ON RootPart.PartID = RootTrace.PartID
+                    INNER JOIN {tables['Part']} AS RootPart ON RootPart.PartID = RootTrace.PartID
                     AND RootPart.PartNumber LIKE '%SL02-%'
                 UNION ALL
 
                 SELECT 
                     child.ChildTraceID, 
                     child.ParentTraceID
-                FROM SpacexERP.trc.GenealogyTraceDetail child
+                FROM {tables['GenealogyTraceDetail']} child
                 INNER JOIN genealogy_parent_cte parent
                     ON parent.ChildTraceID = child.ParentTraceID
             )
@@ -142,31 +200,120 @@ def get_full_magnets_tree(engine, sn):
                    ELSE 'Unknown'
                 END AS [Status]
             FROM genealogy_parent_cte all_parent
-                JOIN SpacexERP.trc.Trace AS ParentTrace ON ParentTrace.TraceID = all_parent.ParentTraceID
-                JOIN SpacexERP.inv.Part AS ParentPart ON ParentPart.PartID = ParentTrace.PartID
-                JOIN SpacexERP.trc.Trace AS ChildTrace ON ChildTrace.TraceID = all_parent.ChildTraceID
-                JOIN SpacexERP.inv.Part AS ChildPart ON ChildPart.PartID = ChildTrace.PartID
-                JOIN SpacexERP.trc.GenealogyTraceDetail t ON t.ChildTraceID = ChildTrace.TraceID AND t.ParentTraceID = ParentTrace.TraceID
-                JOIN SpacexERP.sfc.Requirement r ON r.RequirementID = t.RequirementID and r.PartID = ChildPart.PartID
-                LEFT JOIN SpacexERP.sfc.WorkOrder wo ON wo.WorkOrderID = r.WorkOrderID
-                LEFT JOIN SpacexERP.sfc.Operation op ON op.WorkOrderID = wo.WorkOrderID
-                LEFT JOIN SpacexERP.trc.Trace t2 ON t2.LotCode = CONCAT('WO',wo.BaseID)
-                LEFT JOIN SpacexERP.sfc.Requirement r2 ON r2.OperationID = op.OperationID and r2.PartID = ChildPart.PartID
+                JOIN {tables['Trace']} AS ParentTrace ON ParentTrace.TraceID = all_parent.ParentTraceID
+                JOIN {tables['Part']} AS ParentPart ON ParentPart.PartID = ParentTrace.PartID
+                JOIN {tables['Trace']} AS ChildTrace ON ChildTrace.TraceID = all_parent.ChildTraceID
+                JOIN {tables['Part']} AS ChildPart ON ChildPart.PartID = ChildTrace.PartID
+                JOIN {tables['GenealogyTraceDetail']} t ON t.ChildTraceID = ChildTrace.TraceID AND t.ParentTraceID = ParentTrace.TraceID
+                JOIN {tables['Requirement']} r ON r.RequirementID = t.RequirementID and r.PartID = ChildPart.PartID
+                LEFT JOIN {tables['WorkOrder']} wo ON wo.WorkOrderID = r.WorkOrderID
+                LEFT JOIN {tables['Operation']} op ON op.WorkOrderID = wo.WorkOrderID
+                LEFT JOIN {tables['Trace']} t2 ON t2.LotCode = CONCAT('WO',wo.BaseID)
+                LEFT JOIN {tables['Requirement']} r2 ON r2.OperationID = op.OperationID and r2.PartID = ChildPart.PartID
 
             WHERE ChildPart.Description LIKE '%PERMANENT MAGNET%' or ChildPart.Description LIKE '%THRUSTER ASSEMBLY%'
             AND r2.RequirementID is not NULL
 
-        """, sn 
+        """, sn, chunksize=chunksize, dtype=GENEALOGY_DTYPES if chunksize else None
     )
     return results
 
 
-# find the PartNumber associated with each WorkOrderID
+# maximum number of SXIDs bound in one batched query, SQL Server allows at most 2100 parameters per statement
+SXID_CHUNK_SIZE = 500
+
+
+# pad a list of bound values to the next power of two (at most max_size) by repeating its last value, so lists of
+# similar length share one statement text and the server reuses its plan; repeats do not change an IN (...) filter
+def pad_parameters(values, max_size=SXID_CHUNK_SIZE):
+    size = 1
+    while size < len(values):
+        size *= 2
+    size = max(min(size, max_size), len(values))
+    return list(values) + [values[-1]] * (size - len(values))
+
+
+# same as get_full_magnets_tree for a list of SXIDs, with a RootSN column naming the satellite each row belongs to
+# with chunksize given, the rows of all SXIDs are returned as one iterator of chunks
+def get_full_magnets_trees(engine, sns, chunk_size=SXID_CHUNK_SIZE, tables=ERP_TABLES, chunksize=None):
+    sns = [str(sn) for sn in dict.fromkeys(sns)]
+    if len(sns) == 0:
+        raise ValueError('no SXIDs given')
+    chunks = []
+
+    for i in range(0, len(sns), chunk_size): # one round trip per chunk of SXIDs
+        chunk = pad_parameters(sns[i:i + chunk_size], chunk_size)
+        chunks.append(run_warp_query(engine,
+            f"""
+                WITH genealogy_parent_cte AS (
+                    SELECT 
+                        RootGenealogy.ChildTraceID, 
+                        RootGenealogy.ParentTraceID,
+                        RootTrace.SerialNumber AS RootSN
+                    FROM {tables['GenealogyTraceDetail']} RootGenealogy
+                    INNER JOIN {tables['Trace']} as RootTrace 
+                        ON RootGenealogy.ParentTraceID = RootTrace.TraceID
+                        AND RootTrace.SerialNumber IN ({', '.join('?' * len(chunk))})
+                        INNER JOIN {tables['Part']} AS RootPart ON RootPart.PartID = RootTrace.PartID
+                        AND RootPart.PartNumber LIKE '%SL02-%'
+                    UNION ALL
+
+                    SELECT 
+                        child.ChildTraceID, 
+                        child.ParentTraceID,
+                        parent.RootSN
+                    FROM {tables['GenealogyTraceDetail']} child
+                    INNER JOIN genealogy_parent_cte parent
+                        ON parent.ChildTraceID = child.ParentTraceID
+                )
+                SELECT DISTINCT
+                    all_parent.RootSN,
+                    all_parent.ChildTraceID,
+                    all_parent.ParentTraceID,
+                    ParentPart.Description as ParentDesc,
+                    ParentPart.PartNumber as ParentPN,
+                    ParentTrace.SerialNumber as ParentSN,
+                    ChildPart.Description as ChildDesc,
+                    ChildPart.PartNumber as ChildPN,
+                    ChildTrace.SerialNumber as ChildSN,
+                    r.WorkOrderID as WoID,
+                    t2.SerialNumber as TestSerialNumber,
+                    CASE 
+                       WHEN r2.IssuedQuantity > 0 THEN 'Issued'
+                       WHEN r2.IssuedQuantity < 0 THEN 'Removed'
+                       ELSE 'Unknown'
+                    END AS [Status]
+                FROM genealogy_parent_cte all_parent
+                    JOIN {tables['Trace']} AS ParentTrace ON ParentTrace.TraceID = all_parent.ParentTraceID
+                    JOIN {tables['Part']} AS ParentPart ON ParentPart.PartID = ParentTrace.PartID
+                    JOIN {tables['Trace']} AS ChildTrace ON ChildTrace.TraceID = all_parent.ChildTraceID
+                    JOIN {tables['Part']} AS ChildPart ON ChildPart.PartID = ChildTrace.PartID
+                    JOIN {tables['GenealogyTraceDetail']} t ON t.ChildTraceID = ChildTrace.TraceID AND t.ParentTraceID = ParentTrace.TraceID
+                    JOIN {tables['Requirement']} r ON r.RequirementID = t.RequirementID and r.PartID = ChildPart.PartID
+                    LEFT JOIN {tables['WorkOrder']} wo ON wo.WorkOrderID = r.WorkOrderID
+                    LEFT JOIN {tables['Operation']} op ON op.WorkOrderID = wo.WorkOrderID
+                    LEFT JOIN {tables['Trace']} t2 ON t2.LotCode = CONCAT('WO',wo.BaseID)
+                    LEFT JOIN {tables['Requirement']} r2 ON r2.OperationID = op.OperationID and r2.PartID = ChildPart.PartID
+
+                WHERE ChildPart.Description LIKE '%PERMANENT MAGNET%' or ChildPart.Description LIKE '%THRUSTER ASSEMBLY%'
+                AND r2.RequirementID is not NULL
+
+            """, *chunk, chunksize=chunksize, dtype=GENEALOGY_DTYPES if chunksize else None
+        ))
+
+    if chunksize is not None:
+        return itertools.chain.from_iterable(chunks) # the queries run one after another as the chunks are consumed
+    return pd.concat(chunks, ignore_index=True)
+
+
+# find the PartNumber associated with each WorkOrderID added since the last sync and add them to the mapping file
 def pn_to_wo_mapping(engine):
+    mapping = pwm.get_mapping()
     results = run_warp_query(engine,
         f"""
         select p.PartNumber,wo.WorkOrderID from SpacexERP.sfc.WorkOrder wo
         join SpacexERP.inv.Part p on p.PartID = wo.PartID
-        """                 
+        where wo.WorkOrderID > ?
+        """, mapping.last_work_order()
     )
-    results.to_pickle('pn_wo_map.pkl')
+    mapping.update(results)
@@ -4,14 +4,11 @@ import matplotlib.pyplot as plt
 import math
 from matplotlib.lines import Line2D
 import collections
-import addcopyfighandler
-from haggis.math import full_width_half_max
+import sum_curve as sc
 
-df = pd.read_csv('test_CORRECT.csv')
+# sxids of the satellites classified as mode shifters, loaded by main
+mode_shifters = []
 
-ms = pd.read_csv('classified_CORRECT.csv')
-ms = ms[ms['mode_shifters'] == 'y']
-mode_shifters = list(ms['sxid'])
 
 def find_pt_list(df,i):
     pt_list = []
@@ -51,41 +48,10 @@ def classify_curve(pts):
 
 
 
-# output information for predicted axial curve
-def find_closest_sum_curve(df,sat):
-    df = df[df['sxid'] == sat]
+# output information for predicted axial curve, given the aligned sum curve and the combined curve of a satellite
+def sum_curve_metrics(sat,min_list,combined_pt_list):
     deg_list = range(0,361,12)
-    if len(df['sxid']) != 3:
-        return
-    
-    for i in range(len(df['sxid'])):
-        if df['magnet_type'].iloc[i] == 'inner':
-            inner_pt_list = np.array(find_pt_list(df,i))
-            inner_min = np.argmin(inner_pt_list)
-            inner_pt_list = np.roll(inner_pt_list,-inner_min)
-        elif df['magnet_type'].iloc[i] == 'outer':
-            outer_pt_list = np.array(find_pt_list(df,i))
-            outer_max = np.argmax(outer_pt_list)
-            outer_pt_list = np.roll(outer_pt_list,-outer_max)
-        else:
-            combined_pt_list = np.array(find_pt_list(df,i))
-
-    difflist = np.array([inner_pt_list[i] + outer_pt_list[i] for i in range(len(inner_pt_list))])
 
-    diff = difflist - combined_pt_list
-    squared_residuals = diff ** 2
-    min_diff = np.sum(squared_residuals)
-    min_list = difflist
-
-    for i in range(len(deg_list)-1):
-        difflist = np.roll(difflist,1)
-        diff = difflist - combined_pt_list
-        squared_residuals = diff ** 2
-        if np.sum(squared_residuals) < min_diff:
-            min_diff = np.sum(squared_residuals)
-            min_list = difflist
-
-    
     # calculate stats
     sum_avg = np.mean(min_list)
     comb_avg = np.mean(combined_pt_list)
@@ -98,8 +64,8 @@ def find_closest_sum_curve(df,sat):
     comb_deriv = np.max(abs(np.gradient(combined_pt_list)))
     sum_irr = (np.max(min_list) - np.min(min_list)) / sum_avg * 100
     comb_irr = (np.max(combined_pt_list) - np.min(combined_pt_list)) / comb_avg * 100
-    sum_fwhm = 0#full_width_half_max(deg_list,min_list,factor=0.8)
-    comb_fwhm = 0#full_width_half_max(deg_list,combined_pt_list,factor=0.8)
+    sum_fwhm = 0#haggis.math.full_width_half_max(deg_list,min_list,factor=0.8)
+    comb_fwhm = 0#haggis.math.full_width_half_max(deg_list,combined_pt_list,factor=0.8)
     sum_fft = np.fft.fft(min_list,n=1)
     comb_fft = np.fft.fft(combined_pt_list,n=1)
     sum_min = np.min(min_list)
@@ -120,15 +86,25 @@ def find_closest_sum_curve(df,sat):
 
 
 #-------------output metrics for predicted axial curves----------------------
-dicts = []
+# with store_path the scans are read from the parquet result store (only the flux arrays) instead of the test table
+def main(test_path='test_CORRECT.csv', classified_path='classified_CORRECT.csv', output_path='sum_curve_compare.csv', store_path=None):
+    global mode_shifters
+    mode_shifters = sc.load_mode_shifters(classified_path)
 
-for sat in set(df['sxid']):
-    d = find_closest_sum_curve(df,sat)
-    if d is not None:
-        dicts.append(find_closest_sum_curve(df,sat))
+    dicts = []
 
-final = pd.DataFrame(dicts)
-final.to_csv('sum_curve_compare.csv')
+    if store_path is not None:
+        sats, inner, outer, combined = sc.store_matrices(store_path) # every satellite with an inner, outer and combined scan
+    else:
+        sats, inner, outer, combined = sc.fleet_matrices(pd.read_csv(test_path))
+    aligned, residuals, shifts = sc.align_sum_curves(inner, outer, combined)
+
+    for sat, min_list, combined_pt_list in zip(sats, aligned, combined):
+        dicts.append(sum_curve_metrics(sat,min_list,combined_pt_list))
+
+    final = pd.DataFrame(dicts)
+    final.to_csv(output_path)
+    return final
 
 
 #-----------plot predicted axial superimposed traces------------------------------
@@ -158,3 +134,8 @@ final.to_csv('sum_curve_compare.csv')
 # line6 = Line2D([0], [0], label='Mode shifters', color='orange')
 # plt.legend(handles=[line5,line6])
 # plt.show()
+
+
+if __name__ == '__main__':
+    import addcopyfighandler # copy figures to the clipboard with ctrl+c
+    main()
@@ -3,19 +3,22 @@ import numpy as np
 import matplotlib.pyplot as plt
 import math
 
-df = pd.read_csv('sum_curve_compare.csv')
-df['corr2'] = df['corr'].str.strip('[]').astype(float)
-df['deriv_ratio'] = df['sum_deriv'] / df['comb_deriv']
-df['avg_ratio'] = df['sum_avg'] / df['comb_avg']
-df['std_ratio'] = df['sum_std'] / df['comb_std']
-df['ptp_ratio'] = df['sum_pp'] / df['comb_pp']
-df['sum_fft2'] = df['sum_fft'].str.strip('[+0.j]').astype(float)
-df['comb_fft2'] = df['comb_fft'].str.strip('[+0.j]').astype(float)
-df['irr_ratio'] = df['comb_irr'] / df['sum_irr']
+# read the sum curve metrics written by analyze_sum_curve.py and add the ratio columns
+def load_compare(path='sum_curve_compare.csv'):
+    df = pd.read_csv(path)
+    df['corr2'] = df['corr'].str.strip('[]').astype(float)
+    df['deriv_ratio'] = df['sum_deriv'] / df['comb_deriv']
+    df['avg_ratio'] = df['sum_avg'] / df['comb_avg']
+    df['std_ratio'] = df['sum_std'] / df['comb_std']
+    df['ptp_ratio'] = df['sum_pp'] / df['comb_pp']
+    df['sum_fft2'] = df['sum_fft'].str.strip('[+0.j]').astype(float)
+    df['comb_fft2'] = df['comb_fft'].str.strip('[+0.j]').astype(float)
+    df['irr_ratio'] = df['comb_irr'] / df['sum_irr']
+    return df
 
 
 # output histogram for predicted axial curve
-def output_histo(metric):
+def output_histo(df,metric):
     df_ms = df[df['mode_shifter'] == 'y']
     df_nonms = df[df['mode_shifter'] == 'n']
 
@@ -28,4 +31,12 @@ def output_histo(metric):
     plt.legend()
     plt.show()
 
-output_histo('sum_min')
+
+def main(path='sum_curve_compare.csv', metrics=('sum_min',)):
+    df = load_compare(path)
+    for metric in metrics:
+        output_histo(df,metric)
+
+
+if __name__ == '__main__':
+    main()
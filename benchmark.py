@@ -0,0 +1,278 @@
+# BENCHMARK.PY
+# time the tree building functions on synthetic genealogy tables shaped like the get_full_magnets_tree output
+# and the whole pull pipeline against a local fake otto server, saving the timings as json
+
+import os
+import json
+import time
+import tempfile
+import tracemalloc
+import platform
+import numpy as np
+import pandas as pd
+import networkx as nx
+import build_tree as bt
+import output_tables as ot
+import otto_tests
+import result_store as rs
+from fake_otto_server import FakeOttoServer, MAGNET_PN
+
+DEFAULT_RESULTS_PATH = 'benchmark_results.json'
+
+
+# generate a synthetic genealogy table with a satellite root, thruster assemblies and magnet leaves
+# the tree grows level by level until it has n_rows rows, or stops after depth levels below the thrusters if given
+def synthetic_genealogy(n_rows, sxid='11072', fanout=4, n_thrusters=2, removed_ratio=0.05, seed=0, depth=None):
+    rng = np.random.default_rng(seed)
+    rows = []
+    traceid = 1
+    root_traceid = traceid
+
+    def add_row(parent, child_desc, child_pn):
+        nonlocal traceid
+        traceid += 1
+        status = 'Removed' if rng.random() < removed_ratio else 'Issued'
+        child = (traceid, child_desc, child_pn, f'SN{traceid}')
+        rows.append({'ChildTraceID': traceid, 'ParentTraceID': parent[0], 'ParentDesc': parent[1], 'ParentPN': parent[2], 'ParentSN': parent[3],
+                     'ChildDesc': child_desc, 'ChildPN': child_pn, 'ChildSN': child[3], 'WoID': int(rng.integers(1, 10**6)),
+                     'TestSerialNumber': str(int(rng.integers(10**5, 10**6))), 'Status': status})
+        return child
+
+    root = (root_traceid, 'STARLINK SATELLITE', 'SL02-0001', sxid)
+    current_level = [add_row(root, 'THRUSTER ASSEMBLY', f'SL02-TA{i}') for i in range(n_thrusters)]
+
+    level = 0
+    while len(rows) < n_rows and current_level and (depth is None or level < depth): # expand level by level until the table is big enough
+        level += 1
+        next_level = []
+        for parent in current_level:
+            for i in range(fanout):
+                if len(rows) >= n_rows:
+                    break
+                desc = 'PERMANENT MAGNET' if i % 2 else 'SUBASSEMBLY'
+                next_level.append(add_row(parent, desc, f'PN{len(rows) % 997}-{i}'))
+        current_level = next_level
+
+    return pd.DataFrame(rows)
+
+
+# check that two graphs have the same node ids, node attributes and edges
+def same_graph(G1, G2):
+    if list(G1.nodes) != list(G2.nodes) or list(G1.edges) != list(G2.edges):
+        return False
+    return all(G1.nodes[n] == G2.nodes[n] for n in G1.nodes)
+
+
+# check that two trees have the same nodes in the same order, ignoring how their ids are numbered
+# (add_to_table keeps the ids of the parts before 'Removed' subtrees are deleted, add_to_table_indexed numbers the kept parts only)
+def same_tree(G1, G2):
+    renumber = lambda G: nx.relabel_nodes(G, {n: i for i, n in enumerate(sorted(G))})
+    return same_graph(renumber(G1), renumber(G2))
+
+
+# run a function once and return the elapsed wall time with its output
+def timed(func, *args):
+    start = time.perf_counter()
+    out = func(*args)
+    return time.perf_counter() - start, out
+
+
+# compare the masked and indexed tree builders; the masked builder is only run on the smaller tables
+def bench_add_to_table(sizes=(10_000, 100_000, 1_000_000), masked_limit=10_000):
+    for n in sizes:
+        df = synthetic_genealogy(n)
+        indexed_time, G = timed(bt.add_to_table_indexed, '11072', df)
+        line = f'add_to_table rows={n:>9,} nodes={G.number_of_nodes():>9,} indexed={indexed_time:8.3f}s'
+
+        if n <= masked_limit:
+            masked_time, G_masked = timed(bt.add_to_table, '11072', df)
+            assert same_tree(G, G_masked), 'indexed tree does not match add_to_table'
+            line += f' masked={masked_time:8.3f}s speedup={masked_time / indexed_time:6.1f}x'
+        print(line)
+
+
+
+# compare the compact tree with the networkx tree, in time and in memory held once built (measured with tracemalloc)
+def bench_compact_tree(sizes=(10_000, 100_000, 1_000_000)):
+    for n in sizes:
+        df = ot.create_one_status(synthetic_genealogy(n))
+        tracemalloc.start()
+        graph_time, G = timed(bt.add_to_table_indexed, '11072', df)
+        graph_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        tracemalloc.start()
+        compact_time, tree = timed(bt.compact_tree, '11072', df)
+        compact_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert same_graph(G, tree.to_networkx()), 'compact tree does not match add_to_table_indexed'
+        print(f'compact_tree rows={n:>9,} nodes={len(tree):>9,} networkx={graph_time:8.3f}s {graph_memory / 1e6:8.1f}MB '
+              f'compact={compact_time:8.3f}s {compact_memory / 1e6:8.1f}MB')
+        del G, tree
+
+
+# graph_to_info_output as it was before the columnar export, appending one row per node
+def graph_to_info_output_append(G):
+    table = pd.DataFrame(columns=['PartNumber','SerialNumber','Description','WorkOrderID','TestSerialNumber'])
+    for n in G.nodes:
+        new = pd.Series({'PartNumber':G.nodes[n]['part_number'],'SerialNumber':G.nodes[n]['serial_number'],'Description':G.nodes[n]['desc'], 'WorkOrderID':G.nodes[n]['work_order'], 'TestSerialNumber':G.nodes[n]['test_sn']})
+        table = table._append(new, ignore_index=True)
+    return table.drop_duplicates()
+
+
+# generate a graph with n_nodes part nodes carrying the attributes written by build_networkx_tree
+def synthetic_graph(n_nodes, fanout=4, seed=0):
+    rng = np.random.default_rng(seed)
+    G = nx.DiGraph()
+    for n in range(n_nodes):
+        G.add_node(n, desc='PERMANENT MAGNET' if n % 2 else 'SUBASSEMBLY', part_number=f'PN{n % 997}', serial_number=f'SN{n}',
+                   work_order=int(rng.integers(1, 10**6)), traceid=n, test_sn=str(int(rng.integers(10**5, 10**6))), status='Issued')
+        if n > 0:
+            G.add_edge((n - 1) // fanout, n)
+    return G
+
+
+# compare the columnar node export with the row appending one; the appending export is only run on the smaller graphs
+def bench_graph_to_info_output(sizes=(10_000, 100_000), append_limit=10_000):
+    for n in sizes:
+        G = synthetic_graph(n)
+        columnar_time, table = timed(ot.graph_to_info_output, G)
+        line = f'graph_to_info_output nodes={n:>9,} columnar={columnar_time:8.3f}s'
+
+        if n <= append_limit:
+            append_time, table_append = timed(graph_to_info_output_append, G)
+            assert table.equals(table_append), 'columnar export does not match the appended table'
+            line += f' append={append_time:8.3f}s speedup={append_time / columnar_time:6.1f}x'
+        print(line)
+
+
+
+# create_one_status as it was before vectorizing, with a python callback per (ChildTraceID, ParentTraceID) group
+def create_one_status_apply(df):
+    grouped = df.groupby(['ChildTraceID', 'ParentTraceID'])
+    filtered_rows = grouped.apply(lambda x: x[x['Status'] == 'Removed'] if any(x['Status'] == 'Removed') else x)
+    return filtered_rows.droplevel(0).reset_index(drop=True)
+
+
+# genealogy table with duplicated (ChildTraceID, ParentTraceID) pairs carrying several statuses, like the warp query returns
+def synthetic_status_table(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    n_pairs = max(n_rows // 3, 1)
+    pair = rng.integers(0, n_pairs, n_rows)
+    return pd.DataFrame({'ChildTraceID': pair * 7 + 1, 'ParentTraceID': pair // 4, 'ChildDesc': 'PERMANENT MAGNET', 'ChildPN': 'PN' + pd.Series(pair % 997).astype(str),
+                         'Status': rng.choice(['Issued', 'Removed', 'Unknown'], n_rows, p=[0.8, 0.15, 0.05])})
+
+
+# compare the vectorized status cleanup with the groupby.apply one; the apply version is only run on the smaller tables
+def bench_create_one_status(sizes=(10_000, 100_000, 1_000_000, 5_000_000), apply_limit=10_000):
+    for n in sizes:
+        df = synthetic_status_table(n)
+        vectorized_time, table = timed(ot.create_one_status, df)
+        line = f'create_one_status rows={n:>9,} vectorized={vectorized_time:8.3f}s'
+
+        if n <= apply_limit:
+            apply_time, table_apply = timed(create_one_status_apply, df)
+            assert table.equals(table_apply), 'vectorized status cleanup does not match groupby.apply'
+            line += f' apply={apply_time:8.3f}s speedup={apply_time / vectorized_time:6.1f}x'
+        print(line)
+
+
+
+# time every stage of a satellite pull on a synthetic genealogy, fetching its magnet tests from a fake otto server
+def run_scenarios(n_rows=100_000, depth=None, fanout=4, removed_ratio=0.05, n_test_sns=50, tests_per_sn=12, latency=0.02,
+                  max_workers=otto_tests.DEFAULT_MAX_WORKERS, seed=0):
+    """
+    Return a dictionary with the parameters, the seconds taken by each scenario and the size of its output
+    Args:
+        n_rows, depth, fanout, removed_ratio: shape of the synthetic genealogy, see synthetic_genealogy
+        n_test_sns(int): number of magnet test serial numbers whose tests are fetched from the fake otto server
+        tests_per_sn(int): number of test documents the fake server holds for each test serial number
+        latency(float): seconds the fake server waits before answering each request
+        max_workers(int): concurrent otto fetches
+    """
+    params = {'n_rows': n_rows, 'depth': depth, 'fanout': fanout, 'removed_ratio': removed_ratio, 'n_test_sns': n_test_sns,
+              'tests_per_sn': tests_per_sn, 'latency': latency, 'max_workers': max_workers, 'seed': seed}
+    scenarios = {}
+
+    def record(name, seconds, **sizes):
+        scenarios[name] = {'seconds': round(seconds, 6), **sizes}
+        print(f'{name:<28} {seconds:8.3f}s ' + ' '.join(f'{k}={v:,}' for k, v in sizes.items()))
+
+    df = synthetic_genealogy(n_rows, fanout=fanout, removed_ratio=removed_ratio, seed=seed, depth=depth)
+    seconds, cleaned = timed(ot.create_one_status, df)
+    record('create_one_status', seconds, rows=len(df))
+    seconds, G = timed(bt.add_to_table_indexed, '11072', cleaned)
+    record('add_to_table', seconds, nodes=G.number_of_nodes())
+    seconds, table = timed(ot.graph_to_info_output, G)
+    record('graph_to_info_output', seconds, rows=len(table))
+    seconds, tree = timed(bt.compact_tree, '11072', cleaned)
+    record('compact_tree', seconds, nodes=len(tree), bytes=tree.memory_usage())
+    seconds, tree_table = timed(ot.tree_to_info_output, tree)
+    record('tree_to_info_output', seconds, rows=len(tree_table))
+    assert tree_table.equals(table), 'compact tree table does not match the graph table'
+
+    magnets = table[table['Description'].str.contains('PERMANENT MAGNET')]
+    snpndict = {int(sn): {MAGNET_PN} for sn in pd.unique(magnets['TestSerialNumber'])[:n_test_sns]}
+
+    default_otto = otto_tests.otto
+    found = {}
+    try:
+        # otto_fetch_unfiltered serves pointers without the fields the pointer filter reads, so every document is requested
+        for name, latest_only, pointer_fields in [('otto_fetch_unfiltered', False, False), ('otto_fetch', False, True), ('otto_fetch_latest_only', True, True)]:
+            with FakeOttoServer(tests_per_sn=tests_per_sn, latency=latency, pointer_fields=pointer_fields) as server:
+                otto_tests.otto = otto_tests.OttoQuery(server.host, otto_tests.DEFAULT_API_PATH, max_workers=max_workers)
+                seconds, tests = timed(otto_tests.find_latest_magnet_tests, snpndict, None, latest_only)
+                rows = [otto_tests.generate_magnet_test_entry(test, '11072') for test in tests]
+                found[name] = [test.case_id for test in tests]
+                record(name, seconds, test_sns=len(snpndict), tests=len(tests), **server.stats())
+    finally:
+        otto_tests.otto = default_otto
+    assert found['otto_fetch'] == found['otto_fetch_unfiltered'], 'pointer filter found different tests'
+    assert found['otto_fetch'] == found['otto_fetch_latest_only'], 'latest only fetch found different tests'
+
+    # write rows for many satellites so the writers are timed on more than a handful of rows
+    many_rows = [{**row, 'sxid': str(sxid)} for sxid in range(10_000, 10_000 + max(n_rows // 1000, 1)) for row in rows]
+    with tempfile.TemporaryDirectory() as tmp:
+        seconds, _ = timed(ot.write_test_rows, many_rows, os.path.join(tmp, 'output.csv'))
+        record('write_csv', seconds, rows=len(many_rows))
+        seconds, _ = timed(rs.write_results, many_rows, os.path.join(tmp, 'magnet_store'))
+        record('write_store', seconds, rows=len(many_rows))
+
+    return {'created': pd.Timestamp.now(tz='UTC').isoformat(), 'python': platform.python_version(), 'pandas': pd.__version__,
+            'params': params, 'scenarios': scenarios}
+
+
+# append a scenario run to the json results file, keeping the earlier runs to compare against
+def save_results(results, path=DEFAULT_RESULTS_PATH):
+    runs = []
+    if os.path.exists(path):
+        with open(path) as f:
+            runs = json.load(f)
+    runs.append(results)
+    with open(path, 'w') as f:
+        json.dump(runs, f, indent=2)
+
+
+# return the scenarios that got slower than threshold times their time in the baseline run
+def compare_results(baseline, current, threshold=1.2):
+    regressions = {}
+    for name, scenario in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is not None and before['seconds'] > 0 and scenario['seconds'] > threshold * before['seconds']:
+            regressions[name] = round(scenario['seconds'] / before['seconds'], 2)
+    return regressions
+
+
+if __name__ == '__main__':
+    bench_add_to_table()
+    bench_compact_tree()
+    bench_graph_to_info_output()
+    bench_create_one_status()
+
+    results = run_scenarios()
+    if os.path.exists(DEFAULT_RESULTS_PATH):
+        with open(DEFAULT_RESULTS_PATH) as f:
+            previous = json.load(f)
+        if previous and previous[-1]['params'] == results['params']:
+            for name, ratio in compare_results(previous[-1], results).items():
+                print(f'  {name} is {ratio}x slower than the previous run')
+    save_results(results)
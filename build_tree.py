@@ -5,6 +5,36 @@ import pandas as pd
 import numpy as np
 import networkx as nx
 
+# columns of the genealogy table that the tree is built from
+TREE_COLUMNS = ['ChildTraceID', 'ParentTraceID', 'ParentDesc', 'ParentPN', 'ParentSN', 'ChildDesc', 'ChildPN', 'ChildSN', 'WoID', 'TestSerialNumber', 'Status']
+
+
+# keep only the given columns (all if None) of a chunk of a streamed genealogy table, with every repeated string stored once
+# strings maps each string already seen to its first copy; pass the same dict for all the chunks of a stream, so a description
+# or part number that comes back on many rows is held once instead of once per row
+def compact_chunk(chunk, columns=None, strings=None):
+    strings = {} if strings is None else strings
+    if columns is not None:
+        chunk = chunk[[column for column in columns if column in chunk.columns]]
+    compacted = {}
+    for column in chunk.columns:
+        values = chunk[column].to_numpy()
+        if values.dtype == object:
+            codes, uniques = pd.factorize(values)
+            if len(uniques) <= len(values) // 2: # only columns that repeat, mostly unique ones (serial numbers) are kept as they are
+                shared = np.array([strings.setdefault(value, value) if isinstance(value, str) else value for value in uniques] + [None], dtype=object)
+                missing = codes == -1
+                values = shared[codes]
+                values[missing] = chunk[column].to_numpy()[missing] # None and NaN are kept as they were
+        compacted[column] = values
+    return pd.DataFrame(compacted, index=chunk.index)
+
+
+# concatenate a stream of genealogy chunks, compacting each one as it arrives so only the kept columns are held
+def concat_chunks(chunks, columns=TREE_COLUMNS):
+    strings = {}
+    return pd.concat([compact_chunk(chunk, columns, strings) for chunk in chunks], ignore_index=True)
+
 
 # tree node class that stores relevant information for each part
 class TreeNode:
@@ -85,43 +115,62 @@ def add_next_level(clevel,df,idcount):
     return nlevel,idcount
 
 
+# index the table once by parent key so children can be found with a dict lookup instead of a full-table mask
+def index_children(df):
+    return df.groupby(['ParentPN', 'ParentDesc', 'ParentTraceID'], sort=False).indices
+
+
+# same as add_next_level, but children are looked up in the parent index built by index_children
+# rows with skip_status are not added, so their whole subtree is never expanded
+def add_next_level_indexed(clevel,df,children,idcount,skip_status=None):
+    nlevel = []
+    child_desc, child_pn, child_sn = df['ChildDesc'].values, df['ChildPN'].values, df['ChildSN'].values
+    child_traceid, wo, test_sn, status = df['ChildTraceID'].values, df['WoID'].values, df['TestSerialNumber'].values, df['Status'].values
+
+    for node in clevel:
+        for i in children.get((node.pn, node.description, node.traceid), ()): # iterate through each child row of a specific parent
+            if node.pn == child_pn[i] or (skip_status is not None and status[i] == skip_status):
+                continue
+            new_node = TreeNode(child_desc[i], child_pn[i], idcount, wo[i], child_traceid[i], test_sn[i], status[i], child_sn[i])
+            idcount+=1
+            node.add_child(new_node)
+
+            if (new_node.pn, new_node.description, new_node.traceid) in children: # only nodes with their own children go to the next level
+                nlevel.append(new_node)
+
+    return nlevel,idcount
+
+
 # build a networkx graph given the root node of the tree class
+# nodes are added in depth-first preorder from an explicit stack, so the depth of the tree is not limited by the recursion limit
 def build_networkx_tree(root):
     G = nx.DiGraph()
+    stack = [(None, root)]
 
-    def add_node_to_graph(node):
+    while stack:
+        parent_id, node = stack.pop()
+        if parent_id is not None:
+            G.add_edge(parent_id, node.id)
         G.add_node(node.id, desc = node.description, part_number=node.pn, serial_number=node.sn, work_order=node.wo, traceid = node.traceid, test_sn = node.test_sn, status = node.status)
-        for child in node.children:
-            G.add_edge(node.id, child.id)
-            add_node_to_graph(child)
+        stack.extend((node.id, child) for child in reversed(node.children)) # first child on top of the stack
 
-    add_node_to_graph(root)
     return G
 
 
 # remove all nodes that have 'Removed' status or are in a subtree rooted at a node with 'Removed' status
+# one walk from the root: every node below a node with the status is marked while the walk continues, instead of a new dfs per node
 def remove_subtrees_with_status(graph, root, status):
-    nodes_to_remove = set()
-
-    # identify nodes with 'Removed' status and their subtrees
-    def mark_removed_subtrees(node):
-        if graph.nodes[node]['status'] == status:
-            nodes_to_remove.add(node)
-            T = nx.dfs_tree(graph, source=node)
-            nodes_to_remove.update(set(T.nodes()))
-        for child in graph.successors(node):
-            mark_removed_subtrees(child)
-
-    mark_removed_subtrees(root)
-
-    # reverse traversal to remove nodes
-    nodes_to_remove = list(nodes_to_remove)
-    nodes_to_remove.reverse()  # Start removing from the leaves upwards
+    nodes_to_remove = []
+    stack = [(root, False)]
 
-    for node in nodes_to_remove:
-        if node in graph:
-            graph.remove_node(node)
+    while stack:
+        node, removed = stack.pop()
+        removed = removed or graph.nodes[node]['status'] == status
+        if removed:
+            nodes_to_remove.append(node)
+        stack.extend((child, removed) for child in graph.successors(node))
 
+    graph.remove_nodes_from(nodes_to_remove)
     return graph
 
 
@@ -145,3 +194,191 @@ def add_to_table(sat,df):
     G = build_networkx_tree(root) # build a networkx graph from the tree
     newG = remove_subtrees_with_status(G, 0, 'Removed') # remove all 'Removed' nodes
     return newG
+
+
+# same tree as add_to_table, but the table is indexed by parent once instead of being filtered for every node,
+# and 'Removed' parts are skipped while the tree is expanded instead of being built and deleted afterwards
+# node ids are numbered in BFS order over the kept parts only, so they are consecutive from the satellite root (0)
+# df can also be a stream of chunks, of which only the tree columns are kept (see concat_chunks)
+def add_to_table_indexed(sat,df):
+    sxid = str(sat)
+    if isinstance(df, pd.DataFrame):
+        df = df.reset_index(drop=True)
+    else:
+        df = concat_chunks(df)
+    children = index_children(df)
+
+    beginning_nodes, _ = find_beginning_nodes(df,sxid) # find the satellite root and thruster assembly nodes
+    root = beginning_nodes[0]
+    idcount = 1
+
+    for node in beginning_nodes[1:]:
+        if node.status == 'Removed':
+            continue
+        node.id = idcount
+        idcount+=1
+        root.add_child(node)
+    current_level = list(root.children)  # set up top of the tree
+
+    while len(current_level) != 0: # add the rest of the nodes of the tree, leaving out every 'Removed' subtree
+        current_level,idcount = add_next_level_indexed(current_level,df,children,idcount,skip_status='Removed')
+
+    return build_networkx_tree(root) # build a networkx graph from the tree
+
+
+# node attributes of a CompactTree, named like the networkx node attributes, and the table column each one is read from
+COMPACT_COLUMNS = {'desc': 'ChildDesc', 'part_number': 'ChildPN', 'serial_number': 'ChildSN', 'work_order': 'WoID',
+                   'traceid': 'ChildTraceID', 'test_sn': 'TestSerialNumber', 'status': 'Status'}
+
+
+# part tree stored as arrays instead of TreeNode objects and networkx attribute dicts:
+# node i has parent[i] (-1 for the root), its children are children[child_start[i]:child_start[i + 1]]
+# and its attributes are row i of categorical columns, which store each distinct string once
+class CompactTree(object):
+    """array-backed part tree with the node attributes of build_networkx_tree, node 0 is the root"""
+
+    def __init__(self, parent, columns):
+        """
+        Args:
+            parent: parent node of each node, -1 for the root; every parent has a smaller index than its children
+            columns: {attribute name: values of each node}, missing values are returned as None
+        """
+        self.parent = np.asarray(parent, dtype=np.int32)
+        n = len(self.parent)
+        child_parent = self.parent[1:]
+        self.child_start = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(child_parent, minlength=n), out=self.child_start[1:])
+        self.children = (np.argsort(child_parent, kind='stable') + 1).astype(np.int32) # children grouped by parent, in node order
+        self.columns = {name: pd.Categorical(values) for name, values in columns.items()}
+
+    def __len__(self):
+        return len(self.parent)
+
+    def children_of(self, node):
+        """return the children of a node"""
+        return self.children[self.child_start[node]:self.child_start[node + 1]]
+
+    def _next_level(self, nodes):
+        # children of all nodes in one array, in the order of their parents
+        starts, ends = self.child_start[nodes], self.child_start[np.asarray(nodes) + 1]
+        counts = ends - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.children[np.repeat(starts, counts) + offsets]
+
+    def bfs(self, source=0):
+        """return the nodes of the subtree of source in breadth-first order"""
+        levels = []
+        level = np.array([source], dtype=np.int32)
+        while len(level) != 0:
+            levels.append(level)
+            level = self._next_level(level)
+        return np.concatenate(levels)
+
+    def dfs(self, source=0):
+        """return the nodes of the subtree of source in depth-first preorder, the node order of build_networkx_tree"""
+        order = []
+        stack = [source]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(self.children_of(node)[::-1].tolist()) # first child on top of the stack
+        return np.array(order, dtype=np.int32)
+
+    def subtree_mask(self, nodes):
+        """return a boolean array that is True for the given nodes and all their descendants"""
+        mask = np.zeros(len(self), dtype=bool)
+        level = np.atleast_1d(np.asarray(nodes, dtype=np.int32))
+        while len(level) != 0:
+            mask[level] = True
+            level = self._next_level(level)
+        return mask
+
+    def values(self, name, nodes=None):
+        """return the values of an attribute as an object array, for all nodes or the given ones, with None for missing values"""
+        column = self.columns[name]
+        codes = column.codes if nodes is None else column.codes[nodes]
+        values = np.asarray(column.categories, dtype=object)[codes]
+        values[codes == -1] = None
+        return values
+
+    def node(self, node):
+        """return the attributes of a node, like G.nodes[node] of the networkx tree"""
+        return {name: self.values(name, [node])[0] for name in self.columns}
+
+    def to_frame(self, nodes=None):
+        """return a table with one row per node and one column per attribute, in depth-first preorder unless nodes are given"""
+        nodes = self.dfs() if nodes is None else nodes
+        return pd.DataFrame({name: self.values(name, nodes) for name in self.columns}, index=nodes)
+
+    def to_networkx(self, mask=None):
+        """
+        Return the tree as a networkx graph with the same nodes, edges and attributes as build_networkx_tree
+        Args:
+            mask: boolean array of the nodes to keep, the subtrees of the nodes left out are left out too
+        """
+        order = self.dfs()
+        if mask is not None:
+            keep = mask & ~self.subtree_mask(np.flatnonzero(~mask))
+            order = order[keep[order]]
+        columns = {name: self.values(name, order) for name in self.columns}
+        parents = self.parent[order].tolist()
+
+        G = nx.DiGraph()
+        for i, node in enumerate(order.tolist()):
+            if parents[i] != -1:
+                G.add_edge(parents[i], node)
+            G.add_node(node, **{name: values[i] for name, values in columns.items()})
+        return G
+
+    def memory_usage(self):
+        """return the bytes used by the arrays and columns"""
+        arrays = self.parent.nbytes + self.child_start.nbytes + self.children.nbytes
+        return arrays + sum(column.memory_usage(deep=True) for column in self.columns.values())
+
+
+# same tree as add_to_table_indexed, built straight into a CompactTree without TreeNode objects or a networkx graph
+# node ids are the same: the kept parts numbered in BFS order from the satellite root (0)
+# df can also be a stream of chunks, of which only the tree columns are kept (see concat_chunks)
+def compact_tree(sat,df,skip_status='Removed'):
+    sxid = str(sat)
+    if isinstance(df, pd.DataFrame):
+        df = df.reset_index(drop=True)
+    else:
+        df = concat_chunks(df)
+    children = index_children(df)
+    child_pn, child_desc, child_traceid, status = df['ChildPN'].values, df['ChildDesc'].values, df['ChildTraceID'].values, df['Status'].values
+
+    # the satellite root and the thruster assemblies, as in find_beginning_nodes
+    beginning_rows = np.flatnonzero(df['ChildDesc'].str.contains('THRUSTER ASSEMBLY') & df['ParentDesc'].str.contains('STARLINK SATELLITE'))
+    root_row = beginning_rows[0]
+    parents, rows = [-1], [-1]
+    current_level = []
+    for i in beginning_rows:
+        if status[i] == skip_status:
+            continue
+        current_level.append((len(rows), i))
+        parents.append(0)
+        rows.append(i)
+
+    while len(current_level) != 0: # add the rest of the nodes level by level, like add_next_level_indexed
+        next_level = []
+        for node, row in current_level:
+            for i in children.get((child_pn[row], child_desc[row], child_traceid[row]), ()):
+                if child_pn[row] == child_pn[i] or (skip_status is not None and status[i] == skip_status):
+                    continue
+                if (child_pn[i], child_desc[i], child_traceid[i]) in children: # only nodes with their own children go to the next level
+                    next_level.append((len(rows), i))
+                parents.append(node)
+                rows.append(i)
+        current_level = next_level
+
+    rows = np.array(rows[1:])
+    root_values = {'desc': df['ParentDesc'].iloc[root_row], 'part_number': df['ParentPN'].iloc[root_row], 'serial_number': sxid,
+                   'work_order': None, 'traceid': df['ParentTraceID'].iloc[root_row], 'test_sn': None, 'status': None}
+    columns = {}
+    for name, column in COMPACT_COLUMNS.items():
+        values = np.empty(len(rows) + 1, dtype=object)
+        values[0] = root_values[name]
+        values[1:] = df[column].values[rows]
+        columns[name] = values
+    return CompactTree(parents, columns)
@@ -0,0 +1,120 @@
+# CLI.PY
+# single command line entry point: python cli.py {pull,tree,analyze,plot,report} ...
+# each subcommand imports the modules it needs when it runs, so --help and report start without pandas, bokeh or the database drivers
+
+import sys
+import json
+import argparse
+
+
+# pull magnet test data for a list of satellites (magnet_test_pull.py)
+def pull(args):
+    import magnet_test_pull as mtp
+    kwargs = {'incremental': not args.full, 'write_store': not args.no_store, 'use_mirror': args.mirror, 'latest_only': not args.all_tests}
+    if args.sats:
+        kwargs['sats'] = args.sats
+    if args.workers is not None:
+        kwargs['max_workers'] = args.workers
+    if args.profile:
+        kwargs['profile_stages'] = args.profile
+    summary = mtp.main(**kwargs)
+    return int(summary['error'].notna().any())
+
+
+# render the interactive part tree of satellites (display_interactive_tree.py)
+def tree(args):
+    import display_interactive_tree as dit
+    kwargs = {'directory': args.out, 'scalable': not args.labels, 'max_nodes': args.max_nodes or None}
+    if args.workers is not None:
+        kwargs['max_workers'] = args.workers
+    filenames = dit.main(args.sxids, **kwargs)
+    for sxid in args.sxids:
+        print(f'{sxid}: {filenames.get(str(sxid), "failed")}')
+    return int(len(filenames) < len(set(args.sxids)))
+
+
+# write the predicted axial sum curve metrics of every satellite (analyze_sum_curve.py)
+def analyze(args):
+    import analyze_sum_curve as asc
+    final = asc.main(args.tests, args.classified, args.output, store_path=args.store)
+    print(f'wrote {len(final)} satellites to {args.output}')
+    return 0
+
+
+# show the magnet test plots (master_plots.py and analyze_sum_output.py)
+def plot(args):
+    if args.kind == 'sum-output':
+        import analyze_sum_output as aso
+        aso.main(args.compare, args.metrics or ('sum_min',))
+    else:
+        import master_plots as mp
+        mp.main(args.tests, args.classified, sum_curves=args.kind == 'sum-curves', store_path=args.store)
+    return 0
+
+
+# print the stage totals of the last pull from its run report, without importing the pipeline
+def report(args):
+    with open(args.path) as f:
+        run = json.load(f)
+    print(f"run started {run['started']} took {run['seconds']}s, peak memory {run['peak_memory_mb']} MB")
+    for stage in run['totals']:
+        counters = ' '.join(f'{name}={int(value):,}' for name, value in stage.items() if name not in ('stage', 'seconds') and value)
+        print(f"  {stage['stage']:<8} {stage['seconds']:9.2f}s {counters}")
+    errors = [stage for stage in run['stages'] if stage.get('error')]
+    for stage in errors:
+        print(f"  {stage['sxid']} {stage['stage']} failed: {stage['error']}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description='magnet test data and satellite part tree tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('pull', help='pull magnet test data to output.csv and the parquet store')
+    p.add_argument('sats', nargs='*', help='SXIDs to pull, v2_sats_list in magnet_test_pull.py if none are given')
+    p.add_argument('--full', action='store_true', help='pull every test again and rewrite the rows of the pulled satellites in output.csv instead of an incremental pull')
+    p.add_argument('--all-tests', action='store_true', help='fetch every magnet test document instead of only the newest of each type')
+    p.add_argument('--no-store', action='store_true', help='do not write the parquet store')
+    p.add_argument('--mirror', action='store_true', help='read the genealogy from the local mirror, synced first')
+    p.add_argument('--workers', type=int, help='satellites pulled at the same time')
+    p.add_argument('--profile', nargs='+', metavar='STAGE', help='stages to run under cProfile (sql, status, tree, info, otto, write)')
+    p.set_defaults(func=pull)
+
+    p = commands.add_parser('tree', help='render the interactive part tree html of satellites')
+    p.add_argument('sxids', nargs='+', help='SXIDs to render')
+    p.add_argument('--out', default='.', help='folder the html files are written to')
+    p.add_argument('--workers', type=int, help='satellites queried and rendered at the same time')
+    p.add_argument('--labels', action='store_true', help='draw a Label per node instead of one LabelSet')
+    p.add_argument('--max-nodes', type=int, default=2000, help='collapse the deepest levels of larger trees, 0 draws every node')
+    p.set_defaults(func=tree)
+
+    p = commands.add_parser('analyze', help='write the predicted axial sum curve metrics of every satellite')
+    p.add_argument('--tests', default='test_CORRECT.csv', help='magnet test table')
+    p.add_argument('--classified', default='classified_CORRECT.csv', help='mode shifter classification table')
+    p.add_argument('--output', default='sum_curve_compare.csv', help='metrics table written')
+    p.add_argument('--store', nargs='?', const='magnet_store', help='read the scans from the parquet result store written by pull instead of --tests')
+    p.set_defaults(func=analyze)
+
+    p = commands.add_parser('plot', help='show the magnet test plots')
+    p.add_argument('kind', choices=['histograms', 'sum-curves', 'sum-output'],
+                   help='histograms of the scans, sum curve figures saved to sum_curves/, or histograms of the sum curve metrics')
+    p.add_argument('--tests', default='test_CORRECT.csv', help='magnet test table')
+    p.add_argument('--classified', default='classified_CORRECT.csv', help='mode shifter classification table')
+    p.add_argument('--store', nargs='?', const='magnet_store', help='read the scans from the parquet result store written by pull instead of --tests')
+    p.add_argument('--compare', default='sum_curve_compare.csv', help='metrics table written by analyze')
+    p.add_argument('--metrics', nargs='+', help='sum curve metrics to plot with sum-output')
+    p.set_defaults(func=plot)
+
+    p = commands.add_parser('report', help='print the summary of the last pull')
+    p.add_argument('path', nargs='?', default='run_report.json', help='run report written by pull')
+    p.set_defaults(func=report)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
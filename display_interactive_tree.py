@@ -1,143 +1,36 @@
 # DISPLAY_INTERACTIVE_TREE.PY
-# display interactive html file that shows full tree of satellite parts for thruster and regulator assemblies
+# display interactive html files that show the full tree of satellite parts for thruster and regulator assemblies
 
-import pandas as pd
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
 import networkx as nx
 
 from bokeh.models import Circle
 from bokeh.plotting import figure, output_file
 from bokeh.plotting import from_networkx
 from bokeh.io import save
-from bokeh.models import Label
+from bokeh.models import ColumnDataSource, HoverTool, Label, LabelSet
+import build_tree as bt
 import SQL_queries as sq
 
-# SXID as string - change as necessary
-sxid = '11072'
-
-engine,db = sq.connect_to_sql_server()
-df = sq.get_satpart_children(engine,sxid,['%SL02-%'])
-
-
-# tree node class that stores relevant information for each part
-class TreeNode:
-    def __init__(self, description, pn, id, sn = None):
-        self.description = description
-        self.pn = pn
-        self.sn = sn
-        self.children = []
-        self.parent = []
-        self.id = id
-
-    def add_child(self, child_node):
-        self.children.append(child_node)
-        child_node.parent.append(self)
-
-    def __repr__(self):
-        return f'TreeNode({self.description}, PN: {self.pn}, SN: {self.sn})'
-
-
-# return the part information for the total thruster assembly
-def find_thruster_root_info():
-
-    for i in range(len(df['ChildTraceID'])):
-        if 'STARLINK SATELLITE' in df['ParentDesc'].iloc[i] and 'THRUSTER ASSEMBLY' in df['ChildDesc'].iloc[i] and sxid == df['ParentSN'].iloc[i]:
-            return df['ParentDesc'].iloc[i], df['ParentPN'].iloc[i], df['ChildDesc'].iloc[i], df['ChildPN'].iloc[i], df['ChildSN'].iloc[i]
-
-
-# return the part information for the primary struct integration kit and regulator assembly
-def find_regulator_root_info():
-
-    for i in range(len(df['ChildTraceID'])):
-        if ('PRIMARY STRUCT INTEGRATION KIT' in df['ParentDesc'].iloc[i] or 'PRIMARY STRUCTURE INTEGRATION KIT' in df['ParentDesc'].iloc[i]) and 'REGULATOR ASSEMBLY' in df['ChildDesc'].iloc[i]:
-            return df['ParentDesc'].iloc[i], df['ParentPN'].iloc[i], df['ParentSN'].iloc[i], df['ChildDesc'].iloc[i], df['ChildPN'].iloc[i], df['ChildSN'].iloc[i]
-
-
-# check if a node has more children or if it is a leaf of the tree
-def continue_tree(node):
-    temp_df = df[(df['ParentPN'] == node.pn) & (df['ParentDesc'] == node.description)]
-    return temp_df.shape[0] != 0
-
-
-# add child nodes to all nodes in clevel in BFS order, output a list of the next nodes that have their own children
-def add_next_level(clevel):
-    global idcount
-    nlevel = []
-    for node in clevel:
-        temp_df = df[(df['ParentPN'] == node.pn) & (df['ParentDesc'] == node.description)]
-
-        for i in range(len(temp_df['ChildTraceID'])):
-            if temp_df['ParentPN'].iloc[i] == temp_df['ChildPN'].iloc[i]:
-                continue
-            new_node = TreeNode(temp_df['ChildDesc'].iloc[i], temp_df['ChildPN'].iloc[i],idcount)
-            idcount+=1
-            node.add_child(new_node)
+# SXIDs as strings - change as necessary
+sxids = ['11072']
 
-            if continue_tree(new_node):
-                nlevel.append(new_node)
+# number of satellites queried and rendered at the same time - change as necessary
+MAX_WORKERS = 4
 
-    return nlevel
+# folder of the saved tree layouts, an unchanged tree is not laid out or rendered again
+LAYOUT_CACHE_DIR = 'tree_layout_cache'
 
+# draw all nodes, edges and labels from one data source each instead of a Label per node - change as necessary
+SCALABLE_RENDERING = True
 
-# build a networkx graph given the root node of the tree class
-def build_networkx_tree(root):
-    G = nx.DiGraph()
-
-    def add_node_to_graph(node):
-        G.add_node(node.id, desc = node.description, part_number=node.pn, serial_number=node.sn)
-        for child in node.children:
-            G.add_edge(node.id, child.id)
-            add_node_to_graph(child)
-
-    add_node_to_graph(root)
-    return G
-
-
-colormap = []
-
-# add beginning nodes of the satellite root, thruster assembly, and regulator assembly
-idcount = 0
-sat_description, sat_pn, thruster_description, thruster_pn, thruster_sn = find_thruster_root_info()
-prim_struct_description, prim_struct_pn, prim_struct_sn, regulator_description, regulator_pn, regulator_sn = find_regulator_root_info()
-root = TreeNode(sat_description, sat_pn, idcount, sxid)
-idcount+=1
-thruster_assembly = TreeNode(thruster_description, thruster_pn, idcount, thruster_sn)
-idcount+=1
-prim_struct = TreeNode(prim_struct_description, prim_struct_pn, idcount, prim_struct_sn)
-idcount+=1
-regulator_assembly = TreeNode(regulator_description, regulator_pn, idcount, regulator_sn)
-idcount+=1
-
-
-# add all thruster constituent parts
-root.add_child(thruster_assembly)
-current_level = [thruster_assembly]
-colormap.extend(['purple','blue'])
-while len(current_level) != 0:
-    new_level = add_next_level(current_level)
-    current_level = new_level
-
-cutoff = idcount
-
-for i in range(2, cutoff - 2):
-    colormap.append('blue')
-
-
-# add all regulator constituent parts
-root.add_child(prim_struct)
-prim_struct.add_child(regulator_assembly)
-colormap.extend(['red','green'])
-current_level = [regulator_assembly]
-while len(current_level) != 0:
-    new_level = add_next_level(current_level)
-    current_level = new_level
-
-for i in range(cutoff, idcount):
-    colormap.append('green')
-
-
-# build networkx graph from custom tree
-G = build_networkx_tree(root)
-pos = nx.bfs_layout(G,0)
+# deeper levels of a tree are collapsed into their ancestors until at most this many nodes are drawn, None draws all - change as necessary
+MAX_RENDERED_NODES = 2000
 
 HOVER_TOOLTIPS = [
             ("Name", "@desc"),
@@ -145,21 +38,216 @@ HOVER_TOOLTIPS = [
             ("Serial number", "@serial_number"),
         ]
 
-# create html bokeh plot
-plot = figure(tooltips=HOVER_TOOLTIPS,
-                tools="pan,wheel_zoom,save,reset", active_scroll='wheel_zoom', title='Thruster & Regulator Components for Satellite '+sxid, sizing_mode='stretch_both', width=1000, height=5000)
 
-network_graph = from_networkx(G, nx.bfs_layout(G,0), scale=5, center=(0, 0), pos=pos)
-network_graph.node_renderer.data_source.data['colors'] = colormap
-network_graph.node_renderer.glyph = Circle(radius=0.01,radius_dimension='min', fill_color='colors')
+# pull the as-built parts of a satellite
+def fetch_tree_table(engine, sxid, tables=sq.ERP_TABLES):
+    return sq.get_satpart_children(engine, sxid, ['%SL02-%'], tables=tables)
+
+
+# pull the parts of every satellite once, a few satellites at a time; returns {sxid: table}
+def fetch_tree_tables(engine, sxids, max_workers=MAX_WORKERS, tables=sq.ERP_TABLES):
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tree') as executor:
+        tables_by_sat = executor.map(lambda sxid: fetch_tree_table(engine, sxid, tables), sxids)
+        return dict(zip(sxids, tables_by_sat))
+
+
+# build the networkx graph of the thruster and regulator assemblies of a satellite, each node colored by its branch:
+# satellite purple, thruster assembly parts blue, primary struct integration kit red and regulator assembly parts green
+def build_display_tree(df, sxid):
+    df = df.reset_index(drop=True)
+    children = bt.index_children(df)
+
+    thruster_info = bt.find_thruster_root_info(df, sxid)
+    if thruster_info is None:
+        raise ValueError(f'no thruster assembly found for satellite {sxid}')
+    sat_traceid, sat_description, sat_pn, thruster_traceid, thruster_description, thruster_pn, thruster_sn, thruster_wo, thruster_test_sn, thruster_status = thruster_info
+
+    idcount = 0
+    root = bt.TreeNode(sat_description, sat_pn, idcount, None, sat_traceid, None, None, sxid)
+    idcount+=1
+    thruster_assembly = bt.TreeNode(thruster_description, thruster_pn, idcount, thruster_wo, thruster_traceid, thruster_test_sn, thruster_status, thruster_sn)
+    idcount+=1
+    root.add_child(thruster_assembly)
+    branches = [(thruster_assembly, 'blue')]
+
+    regulator_info = bt.find_regulator_root_info(df)
+    if regulator_info is not None:
+        prim_struct_traceid, prim_struct_description, prim_struct_pn, prim_struct_sn, regulator_traceid, regulator_description, regulator_pn, regulator_sn, regulator_wo, regulator_test_sn, regulator_status = regulator_info
+        prim_struct = bt.TreeNode(prim_struct_description, prim_struct_pn, idcount, None, prim_struct_traceid, None, None, prim_struct_sn)
+        idcount+=1
+        regulator_assembly = bt.TreeNode(regulator_description, regulator_pn, idcount, regulator_wo, regulator_traceid, regulator_test_sn, regulator_status, regulator_sn)
+        idcount+=1
+        root.add_child(prim_struct)
+        prim_struct.add_child(regulator_assembly)
+        branches.append((regulator_assembly, 'green'))
+
+    # add all constituent parts of each assembly
+    for branch_root, _ in branches:
+        current_level = [branch_root]
+        while len(current_level) != 0:
+            current_level,idcount = bt.add_next_level_indexed(current_level,df,children,idcount)
+
+    G = bt.build_networkx_tree(root)
+    nx.set_node_attributes(G, 'red', 'color')
+    G.nodes[root.id]['color'] = 'purple'
+    for branch_root, color in branches:
+        for node_id in [branch_root.id, *nx.descendants(G, branch_root.id)]:
+            G.nodes[node_id]['color'] = color
+    return G
 
-for node_id in G.nodes:
-    node_description = G.nodes[node_id]['desc']
-    label = Label(x=pos[node_id][0] + 0.002, y=pos[node_id][1], text=node_description, 
-                  text_font_size="7pt", text_color="black", 
-                  text_align='left', text_baseline='bottom')
-    plot.add_layout(label)
 
-plot.renderers.append(network_graph)
-output_file(filename=str(f'{sxid}tree.html'))
-save(plot, filename=f'{sxid}tree.html')
+# collapse the deepest levels of a tree until it has at most max_nodes nodes (the root and its children are always kept)
+# each node at the new bottom level that lost descendants gets their count in 'hidden' and '(+N parts)' in its description
+def collapse_tree(G, root=0, max_nodes=MAX_RENDERED_NODES):
+    if max_nodes is None or G.number_of_nodes() <= max_nodes:
+        return G
+
+    depth = nx.single_source_shortest_path_length(G, root) # bfs, so the nodes come out level by level
+    nodes_per_level = np.bincount(list(depth.values()))
+    max_depth = max(int(np.searchsorted(np.cumsum(nodes_per_level), max_nodes, side='right')) - 1, 1)
+
+    subtree_size = {}
+    for node in reversed(list(depth)): # children before their parents
+        subtree_size[node] = 1 + sum(subtree_size[child] for child in G.successors(node))
+
+    collapsed = G.subgraph([node for node, d in depth.items() if d <= max_depth]).copy()
+    for node, d in depth.items():
+        if d == max_depth and subtree_size[node] > 1:
+            collapsed.nodes[node]['hidden'] = subtree_size[node] - 1
+            collapsed.nodes[node]['desc'] = f"{collapsed.nodes[node]['desc']} (+{subtree_size[node] - 1} parts)"
+    return collapsed
+
+
+# return a hash of the nodes, labels and edges of a tree; the layout and html of a tree with the same hash can be reused
+def tree_key(G):
+    nodes = [(n, G.nodes[n]['desc'], G.nodes[n]['part_number'], G.nodes[n]['serial_number'], G.nodes[n]['color']) for n in G.nodes]
+    return hashlib.sha1(json.dumps([nodes, list(G.edges)], default=str).encode()).hexdigest()
+
+
+# return the saved cache entry of a satellite tree, or None
+def read_layout_cache(sxid, cache_dir=LAYOUT_CACHE_DIR):
+    path = os.path.join(cache_dir, f'{sxid}.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+# save the layout of a satellite tree with the hash of the tree it belongs to and the html file rendered from it
+def write_layout_cache(sxid, key, pos, filename, cache_dir=LAYOUT_CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, f'{sxid}.json'), 'w') as f:
+        json.dump({'key': key, 'filename': filename, 'pos': {str(n): [float(x), float(y)] for n, (x, y) in pos.items()}}, f)
+
+
+# draw a tree with its precomputed layout and save it as an html file
+# scalable draws the nodes, edges and labels as three glyph renderers over two data sources holding only what is displayed
+def render_tree(G, pos, sxid, filename, scalable=SCALABLE_RENDERING):
+    if scalable:
+        render_tree_glyphs(G, pos, sxid, filename)
+        return
+
+    # create html bokeh plot
+    plot = figure(tooltips=HOVER_TOOLTIPS,
+                    tools="pan,wheel_zoom,save,reset", active_scroll='wheel_zoom', title='Thruster & Regulator Components for Satellite '+sxid, sizing_mode='stretch_both', width=1000, height=5000)
+
+    network_graph = from_networkx(G, pos)
+    network_graph.node_renderer.data_source.data['colors'] = [G.nodes[n]['color'] for n in network_graph.node_renderer.data_source.data['index']]
+    network_graph.node_renderer.glyph = Circle(radius=0.01,radius_dimension='min', fill_color='colors')
+
+    for node_id in G.nodes:
+        node_description = G.nodes[node_id]['desc']
+        label = Label(x=pos[node_id][0] + 0.002, y=pos[node_id][1], text=node_description,
+                      text_font_size="7pt", text_color="black",
+                      text_align='left', text_baseline='bottom')
+        plot.add_layout(label)
+
+    plot.renderers.append(network_graph)
+    output_file(filename=filename)
+    save(plot, filename=filename)
+
+
+# same plot as render_tree, with one data source for the nodes and their labels and one for the edges
+def render_tree_glyphs(G, pos, sxid, filename):
+    nodes = list(G.nodes)
+    xy = np.array([pos[n] for n in nodes], dtype=float).reshape(-1, 2)
+    node_source = ColumnDataSource({
+        'x': xy[:, 0], 'y': xy[:, 1],
+        'desc': [G.nodes[n]['desc'] for n in nodes],
+        'part_number': [str(G.nodes[n]['part_number']) for n in nodes],
+        'serial_number': [None if G.nodes[n]['serial_number'] is None else str(G.nodes[n]['serial_number']) for n in nodes],
+        'colors': [G.nodes[n]['color'] for n in nodes],
+    })
+    start = np.array([pos[u] for u, _ in G.edges], dtype=float).reshape(-1, 2)
+    end = np.array([pos[v] for _, v in G.edges], dtype=float).reshape(-1, 2)
+    edge_source = ColumnDataSource({'x0': start[:, 0], 'y0': start[:, 1], 'x1': end[:, 0], 'y1': end[:, 1]})
+
+    # create html bokeh plot
+    plot = figure(tools="pan,wheel_zoom,save,reset", active_scroll='wheel_zoom', title='Thruster & Regulator Components for Satellite '+sxid,
+                  sizing_mode='stretch_both', width=1000, height=5000, output_backend='webgl')
+    plot.segment('x0', 'y0', 'x1', 'y1', source=edge_source, line_color='#cccccc')
+    node_renderer = plot.add_glyph(node_source, Circle(radius=0.01, radius_dimension='min', fill_color='colors'))
+    plot.add_layout(LabelSet(x='x', y='y', text='desc', source=node_source, x_offset=2,
+                             text_font_size="7pt", text_color="black", text_align='left', text_baseline='bottom'))
+    plot.add_tools(HoverTool(tooltips=HOVER_TOOLTIPS, renderers=[node_renderer]))
+
+    output_file(filename=filename)
+    save(plot, filename=filename)
+
+
+# build, lay out and render the tree of one satellite from its parts table, returning the html file name
+# the layout is computed once and cached, and nothing is rendered if the tree and its html file are unchanged
+# trees with more than max_nodes nodes have their deepest levels collapsed first (see collapse_tree)
+def render_satellite(sxid, df, directory='.', cache_dir=LAYOUT_CACHE_DIR, scalable=SCALABLE_RENDERING, max_nodes=MAX_RENDERED_NODES):
+    filename = os.path.join(directory, f'{sxid}tree.html')
+    G = collapse_tree(build_display_tree(df, sxid), 0, max_nodes)
+    key = tree_key(G) + ('' if scalable else '-labels')
+
+    cached = read_layout_cache(sxid, cache_dir)
+    if cached is not None and cached['key'] == key:
+        if cached['filename'] == filename and os.path.exists(filename):
+            return filename
+        pos = {int(n): xy for n, xy in cached['pos'].items()}
+    else:
+        pos = nx.bfs_layout(G, 0)
+
+    render_tree(G, pos, sxid, filename, scalable)
+    write_layout_cache(sxid, key, pos, filename, cache_dir)
+    return filename
+
+
+# render the trees of a list of satellites, querying each satellite once and rendering them in parallel processes
+def render_trees(sxids, engine, directory='.', max_workers=MAX_WORKERS, cache_dir=LAYOUT_CACHE_DIR, tables=sq.ERP_TABLES,
+                 scalable=SCALABLE_RENDERING, max_nodes=MAX_RENDERED_NODES):
+    """
+    Return {sxid: html file name} of the satellites that were rendered, the others are printed with their error
+    Args:
+        sxids: SXIDs as strings
+        engine: engine of the ERP database, or GenealogyMirror.engine() with tables=genealogy_mirror.MIRROR_TABLES
+        directory(string): folder the html files are written to
+        max_workers(int): number of satellites queried and rendered at the same time
+        cache_dir(string): folder of the cached layouts
+        scalable(bool): draw the labels with one LabelSet instead of a Label per node
+        max_nodes(int): collapse the deepest levels of larger trees, None draws every node
+    """
+    sxids = [str(sxid) for sxid in dict.fromkeys(sxids)]
+    tables_by_sat = fetch_tree_tables(engine, sxids, max_workers, tables)
+    filenames = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor: # layout and html generation are cpu bound
+        futures = {sxid: executor.submit(render_satellite, sxid, tables_by_sat[sxid], directory, cache_dir, scalable, max_nodes) for sxid in sxids}
+        for sxid, future in futures.items():
+            try:
+                filenames[sxid] = future.result()
+            except Exception as e:
+                print(f'{sxid} tree failed: {e}')
+    return filenames
+
+
+# connect to the ERP database and render the trees of the satellites
+def main(sxids=sxids, directory='.', max_workers=MAX_WORKERS, scalable=SCALABLE_RENDERING, max_nodes=MAX_RENDERED_NODES):
+    engine,db = sq.connect_to_sql_server()
+    return render_trees(sxids, engine, directory, max_workers, scalable=scalable, max_nodes=max_nodes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# DOCUMENT_CACHE.PY
+# local on-disk cache for completed otto result documents, which never change once they are completed
+
+import os
+import json
+import zlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = 'otto_cache'
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+# compressed document cache keyed by case_id with a total size cap and least recently used eviction
+class DocumentCache(object):
+    """on-disk cache of otto documents, one zlib compressed json file per case_id"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, bypass=False):
+        """
+        Args:
+            directory(string): folder the documents are stored in, created on the first write
+            max_bytes(int): total size of the stored files before the least recently used are evicted
+            bypass(bool): if True nothing is read from or written to the cache
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._entries = None # case_id -> file size, ordered from least to most recently used
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, case_id):
+        return os.path.join(self.directory, '{}.json.z'.format(case_id))
+
+    def _load_entries(self):
+        """scan the cache folder once, ordering the files by their last access"""
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        if not os.path.isdir(self.directory):
+            return
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json.z'):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, name[:-len('.json.z')], stat.st_size))
+        for _, case_id, size in sorted(files):
+            self._entries[case_id] = size
+            self._total_bytes += size
+
+    def get(self, case_id):
+        """return the cached document dictionary for a case_id or None"""
+        data = self.get_raw(case_id)
+        return json.loads(data) if data is not None else None
+
+    def get_raw(self, case_id):
+        """return the cached json bytes of a case_id or None"""
+        if self.bypass:
+            return None
+        with self._lock:
+            self._load_entries()
+            if case_id not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(case_id), 'rb') as f:
+                    data = f.read()
+                os.utime(self._path(case_id)) # the file time keeps the LRU order across runs
+            except OSError:
+                self._total_bytes -= self._entries.pop(case_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(case_id)
+            self.hits += 1
+        return zlib.decompress(data)
+
+    def put(self, case_id, db_dict):
+        """store a document, only completed documents are cached since they cannot change"""
+        self.put_raw(case_id, json.dumps(db_dict, separators=(',', ':')).encode(), completed=bool(db_dict.get('completed')))
+
+    def put_raw(self, case_id, raw, completed):
+        """store the json bytes of a document, only if the document is completed"""
+        if self.bypass or not completed:
+            return
+        data = zlib.compress(raw)
+        with self._lock:
+            self._load_entries()
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self._path(case_id) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(case_id))
+
+            self._total_bytes += len(data) - self._entries.pop(case_id, 0)
+            self._entries[case_id] = len(data)
+            self._evict()
+
+    def _evict(self):
+        """remove the least recently used documents until the cache fits in max_bytes"""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            case_id, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(case_id))
+            except OSError:
+                pass
+
+    def stats(self):
+        """return the hit/miss counters and the current cache size"""
+        with self._lock:
+            self._load_entries()
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'bytes': self._total_bytes}
@@ -0,0 +1,181 @@
+# FAKE_OTTO_SERVER.PY
+# local stand-in for the otto results api serving synthetic magnet test documents, used by benchmark.py and the tests
+
+import json
+import time
+import zlib
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# part number written in the part_number reference of every generated document
+MAGNET_PN = 'SL02-MAG1'
+
+FLUX_NAMES = [f'Magnetic flux density at rotation {float(deg)} degrees' for deg in range(0,361,12)]
+
+
+# build a magnet test document shaped like the ones otto returns for a radial, inner axial, outer axial or other test
+def magnet_document(case_id, sn, kind, completed, outcome='pass', pn=MAGNET_PN, seed=0):
+    rng = np.random.default_rng(seed)
+    mean_flux = {'Radial': 900.0, 'inner': 950.0, 'outer': 450.0}.get(kind, 800.0)
+    angles = np.radians(np.arange(0, 361, 12))
+    flux = mean_flux + 0.1 * mean_flux * np.sin(angles + rng.uniform(0, 2 * np.pi)) + rng.normal(0, 2, len(angles))
+
+    if kind == 'Radial':
+        name = 'magnet Radial flux scan'
+    elif kind in ('inner', 'outer'):
+        name = 'magnet Axial flux scan'
+    else:
+        name = 'leak test'
+
+    metrics = {'Average Magnetic Flux': flux.mean(), 'Standard Deviation': flux.std(), 'Minimum Magnetic Flux Density': flux.min(),
+               'Maximum Magnetic Flux Density': flux.max(), 'Irregularity': (flux.max() - flux.min()) / flux.mean()}
+    steps = [
+        {'description': 'Collect Magnetic flux samples', 'measurements': [[i, {'name': n, 'value': float(v), 'unit': 'G'}] for i, (n, v) in enumerate(zip(FLUX_NAMES, flux))]},
+        {'description': 'Compare against expected properties', 'measurements': [[i, {'name': n, 'value': float(v), 'unit': 'G'}] for i, (n, v) in enumerate(metrics.items())]},
+    ]
+    return {'completed': completed, 'description': '', 'links': [{'name': 'otto_results', 'path': f'/report/{case_id}'}], 'measurements': [],
+            'name': name, 'outcome': outcome, 'production_test': True,
+            'references': [{'ref_type': 'serial_number', 'ref_id': str(sn)}, {'ref_type': 'part_number', 'ref_id': pn}],
+            'requirements': [], 'rules': [], 'started': completed, 'steps': steps, 'tags': [], 'test_system': 'magnet-scanner',
+            'tools': [], 'uuid': case_id, 'version': 1}
+
+
+# otto results api serving tests for any serial number: each one gets tests_per_sn documents generated from the serial number
+class FakeOttoServer(object):
+    """threaded http server answering references queries (with paging) and document requests after a fixed latency"""
+
+    def __init__(self, tests_per_sn=12, latency=0.0, failure_ratio=0.0, jitter=0.0, error_statuses=(), pointer_fields=True):
+        """
+        Args:
+            tests_per_sn(int): number of test documents referencing each serial number
+            latency(float): seconds slept before answering each request
+            failure_ratio(float): fraction of the tests with a failing outcome
+            jitter(float): up to this many seconds are added at random to the latency of each request
+            error_statuses: http statuses answered, in order, to the first requests of every url before it is served (e.g. (429, 503))
+            pointer_fields(bool): reference pointers carry the name, outcome and part_number of their test, not only case_id and completed
+        """
+        self.tests_per_sn = tests_per_sn
+        self.latency = latency
+        self.failure_ratio = failure_ratio
+        self.jitter = jitter
+        self.error_statuses = tuple(error_statuses)
+        self.pointer_fields = pointer_fields
+        self.requests = 0
+        self.document_requests = 0
+        self.bytes_sent = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._attempts = {}
+        self._documents = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def documents(self, sn):
+        """the (case_id, document) pairs of a serial number, generated the first time and kept for later requests"""
+        with self._lock:
+            if sn not in self._documents:
+                seed = zlib.crc32(str(sn).encode())
+                rng = np.random.default_rng(seed)
+                kinds = rng.choice(['Radial', 'inner', 'outer', 'other'], self.tests_per_sn, p=[0.3, 0.3, 0.3, 0.1])
+                days = rng.choice(np.arange(365 * 3), self.tests_per_sn, replace=False)
+                docs = []
+                for i, (kind, day) in enumerate(zip(kinds, days)):
+                    case_id = f'{sn}-{i:04d}'
+                    completed = str(np.datetime64('2021-01-01T08:00:00') + np.timedelta64(int(day), 'D'))
+                    outcome = 'fail' if rng.random() < self.failure_ratio else 'pass'
+                    docs.append((case_id, magnet_document(case_id, sn, kind, completed, outcome, seed=seed + i)))
+                self._documents[sn] = docs
+            return self._documents[sn]
+
+    def document(self, case_id):
+        sn = case_id.rsplit('-', 1)[0]
+        return dict(self.documents(sn))[case_id]
+
+    def pointer(self, case_id, doc):
+        """the reference pointer of a document"""
+        result_pointer = {'case_id': case_id, 'completed': doc['completed']}
+        if self.pointer_fields:
+            part_number = next(ref['ref_id'] for ref in doc['references'] if ref['ref_type'] == 'part_number')
+            result_pointer.update(name=doc['name'], outcome=doc['outcome'], part_number=part_number)
+        return result_pointer
+
+    def _respond(self, path, query):
+        """return the json body of a request, or None for an unknown path"""
+        if path.endswith('/references'):
+            pointers = [self.pointer(case_id, doc) for sn in query.get('reference_value', []) for case_id, doc in self.documents(sn)]
+            items_per_page = int(query.get('items_per_page', [len(pointers) or 1])[0])
+            page = int(query.get('page', [1])[0])
+            return {'total_items': len(pointers), 'items': pointers[(page - 1) * items_per_page:page * items_per_page]}
+        if '/documents/' in path:
+            with self._lock:
+                self.document_requests += 1
+            return self.document(path.rsplit('/', 1)[1])
+        return None
+
+    def start(self):
+        """start serving in a background thread and return the host location to give OttoQuery"""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # keep-alive, like the real api behind the pooled session
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                    attempt = server._attempts.get(self.path, 0)
+                    server._attempts[self.path] = attempt + 1
+                try:
+                    time.sleep(server.latency + (np.random.uniform(0, server.jitter) if server.jitter else 0))
+                    if attempt < len(server.error_statuses): # transient failure before the url is served
+                        status, body = server.error_statuses[attempt], {'error': 'try again'}
+                    else:
+                        url = urlparse(self.path)
+                        try:
+                            body = server._respond(url.path, parse_qs(url.query))
+                        except (KeyError, ValueError):
+                            body = None
+                        status, body = (200, body) if body is not None else (404, {'error': 'not found'})
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+                data = json.dumps(body).encode()
+                with server._lock:
+                    server.requests += 1
+                    server.bytes_sent += len(data)
+                    server.errors += status != 200
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self):
+        """return the request counters"""
+        with self._lock:
+            return {'requests': self.requests, 'document_requests': self.document_requests, 'bytes_sent': self.bytes_sent,
+                    'errors': self.errors, 'max_in_flight': self.max_in_flight}
+
+    def __enter__(self):
+        self.host = self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
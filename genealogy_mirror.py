@@ -0,0 +1,140 @@
+# GENEALOGY_MIRROR.PY
+# local sqlite copy of the ERP genealogy tables used by the magnet tree queries, synced incrementally
+
+import sqlite3
+import threading
+
+from sqlalchemy import create_engine, event
+
+import SQL_queries as sq
+
+DEFAULT_MIRROR_PATH = 'genealogy_mirror.db'
+
+# columns copied from each ERP table, the first one is its primary key
+MIRROR_COLUMNS = {
+    'GenealogyTraceDetail': ['GenealogyTraceDetailID', 'ChildTraceID', 'ParentTraceID', 'RequirementID'],
+    'Trace': ['TraceID', 'PartID', 'SerialNumber', 'LotCode'],
+    'Part': ['PartID', 'PartNumber', 'Description'],
+    'Requirement': ['RequirementID', 'PartID', 'WorkOrderID', 'OperationID', 'IssuedQuantity'],
+    'WorkOrder': ['WorkOrderID', 'BaseID', 'PartID'],
+    'Operation': ['OperationID', 'WorkOrderID', 'SequenceNumber'],
+}
+
+# columns stored as text, every other column is an integer (nullable ids come back from pandas as floats and are stored as integers again)
+TEXT_COLUMNS = {'SerialNumber', 'LotCode', 'PartNumber', 'Description', 'BaseID'}
+
+# indexes for the parent -> child walk of the recursive query and the joins made on every row it returns
+MIRROR_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS genealogy_parent ON GenealogyTraceDetail (ParentTraceID, ChildTraceID)',
+    'CREATE INDEX IF NOT EXISTS genealogy_child ON GenealogyTraceDetail (ChildTraceID, ParentTraceID)',
+    'CREATE INDEX IF NOT EXISTS trace_sn ON Trace (SerialNumber)',
+    'CREATE INDEX IF NOT EXISTS trace_lot ON Trace (LotCode)',
+    'CREATE INDEX IF NOT EXISTS requirement_operation ON Requirement (OperationID, PartID)',
+    'CREATE INDEX IF NOT EXISTS operation_wo ON Operation (WorkOrderID)',
+]
+
+# table names to pass as the tables argument of the SQL_queries tree queries when they run on the mirror
+MIRROR_TABLES = {table: table for table in MIRROR_COLUMNS}
+
+# rows read from the ERP database and inserted into the mirror at a time
+SYNC_CHUNK_SIZE = 50_000
+
+
+# SQL Server's CONCAT for sqlite versions that do not have it, NULL arguments count as empty strings
+def _concat(*values):
+    return ''.join('' if value is None else str(value) for value in values)
+
+
+# sqlite mirror of the genealogy tables; the ERP tables are append-only by primary key, so a sync only copies the rows
+# with a key above the largest one already mirrored
+class GenealogyMirror(object):
+    """local copy of the GenealogyTraceDetail/Trace/Part/Requirement/WorkOrder/Operation columns the tree queries read"""
+
+    def __init__(self, path=DEFAULT_MIRROR_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        con = self.connect()
+        try:
+            with con:
+                for table, columns in MIRROR_COLUMNS.items():
+                    definitions = [f'{column} {"TEXT" if column in TEXT_COLUMNS else "INTEGER"}' for column in columns[1:]]
+                    con.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns[0]} INTEGER PRIMARY KEY, {", ".join(definitions)})')
+                for index in MIRROR_INDEXES:
+                    con.execute(index)
+                con.execute('CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, last_key INTEGER NOT NULL)')
+        finally:
+            con.close()
+
+    def connect(self):
+        """
+        Return a new sqlite connection to the mirror, usable as the engine of the SQL_queries tree queries with
+        tables=MIRROR_TABLES; each thread should open its own
+        """
+        con = sqlite3.connect(self.path)
+        con.create_function('CONCAT', -1, _concat, deterministic=True)
+        return con
+
+    def engine(self):
+        """return a sqlalchemy engine on the mirror that can be shared between threads, like the ERP engine"""
+        engine = create_engine(f'sqlite:///{self.path}')
+
+        @event.listens_for(engine, 'connect')
+        def register_concat(con, record):
+            con.create_function('CONCAT', -1, _concat, deterministic=True)
+
+        return engine
+
+    def last_key(self, table):
+        """return the largest primary key mirrored from a table, 0 if none"""
+        con = self.connect()
+        try:
+            row = con.execute('SELECT last_key FROM sync_state WHERE name = ?', (table,)).fetchone()
+        finally:
+            con.close()
+        return row[0] if row is not None else 0
+
+    def sync(self, engine, tables=sq.ERP_TABLES, chunksize=SYNC_CHUNK_SIZE, full=False):
+        """
+        Copy the ERP rows added since the last sync and return the number of rows copied per table
+        Args:
+            engine: connection to the ERP database
+            tables: ERP table names, see SQL_queries.ERP_TABLES
+            chunksize(int): rows read and inserted at a time
+            full(bool): copy every row again, to pick up rows that were edited in place
+        """
+        copied = {}
+        with self._lock:
+            con = self.connect()
+            try:
+                for table, columns in MIRROR_COLUMNS.items():
+                    last_key = 0 if full else self.last_key(table)
+                    insert = f'INSERT OR REPLACE INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+                    copied[table] = 0
+                    chunks = sq.run_warp_query_chunks(engine,
+                        f"""
+                        SELECT {', '.join(columns)} FROM {tables[table]}
+                        WHERE {columns[0]} > ?
+                        ORDER BY {columns[0]}
+                        """, last_key, chunksize=chunksize
+                    )
+                    for chunk in chunks:
+                        if len(chunk) == 0:
+                            continue
+                        with con: # the rows and the new watermark are committed together, an interrupted sync resumes from there
+                            con.executemany(insert, chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None))
+                            con.execute('INSERT OR REPLACE INTO sync_state (name, last_key) VALUES (?, ?)', (table, int(chunk[columns[0]].max())))
+                        copied[table] += len(chunk)
+                con.execute('ANALYZE') # refresh the planner statistics for the recursive query
+            finally:
+                con.close()
+        return copied
+
+    def magnets_trees(self, sns, chunksize=None):
+        """same as SQL_queries.get_full_magnets_trees, read from the mirror; a streamed result keeps its connection until it is consumed"""
+        con = self.connect()
+        if chunksize is not None:
+            return sq.get_full_magnets_trees(con, sns, tables=MIRROR_TABLES, chunksize=chunksize)
+        try:
+            return sq.get_full_magnets_trees(con, sns, tables=MIRROR_TABLES)
+        finally:
+            con.close()
@@ -0,0 +1,184 @@
+# INSTRUMENTATION.PY
+# per satellite and per stage timings and counters for fleet pulls, written to a json run report
+
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError: # not available on windows, peak memory is then not reported
+    resource = None
+
+DEFAULT_REPORT_PATH = 'run_report.json'
+DEFAULT_PROFILE_DIR = 'profiles'
+
+# counters a stage can accumulate, added to by count() from anywhere below the stage
+COUNTERS = ('sql_rows', 'http_requests', 'http_bytes', 'cache_hits', 'cache_misses')
+
+_report = contextvars.ContextVar('run_report', default=None)
+_record = contextvars.ContextVar('stage_record', default=None)
+_count_lock = threading.Lock()
+
+
+# return the peak resident memory of the process in MB, None where it cannot be read
+# it is the high-water mark of the whole process since it started, recorded with each stage but not attributable to it
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1) # bytes on macOS, kilobytes on linux
+
+
+# profiling hook that runs a stage under cProfile and saves its stats to directory/<stage>_<sxid>.prof
+def cprofile_hook(directory=DEFAULT_PROFILE_DIR):
+    @contextmanager
+    def hook(name, sxid):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError: # another stage is already being profiled on a different thread
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(directory, f'{name}_{sxid if sxid is not None else "fleet"}.prof'))
+    return hook
+
+
+# collects one record per (satellite, stage) of a run
+class RunReport(object):
+    """timings and counters of every stage run while the report is active, see stage() and count()"""
+
+    def __init__(self, profile_stages=(), profile_hook=None):
+        """
+        Args:
+            profile_stages: names of the stages to wrap with the profiling hook
+            profile_hook: function of (stage name, sxid) returning a context manager around the stage, cProfile by default
+        """
+        self.profile_stages = set(profile_stages)
+        self.profile_hook = profile_hook or cprofile_hook()
+        self.records = []
+        self.started = pd.Timestamp.now(tz='UTC')
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._token = None
+
+    def __enter__(self):
+        self._token = _report.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _report.reset(self._token)
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def to_frame(self):
+        """one row per stage record"""
+        return pd.DataFrame(self.records, columns=['sxid', 'stage', 'seconds', *COUNTERS, 'peak_memory_mb', 'error'])
+
+    def totals(self):
+        """seconds and counters summed over the satellites for each stage, in the order the stages first ran"""
+        df = self.to_frame()
+        return df.groupby('stage', sort=False)[['seconds', *COUNTERS]].sum()
+
+    def write(self, path=DEFAULT_REPORT_PATH):
+        """write the run report as json"""
+        df = self.to_frame()
+        report = {'started': self.started.isoformat(), 'seconds': round(time.perf_counter() - self._start, 3), 'peak_memory_mb': peak_memory_mb(),
+                  'totals': self.totals().reset_index().to_dict(orient='records'),
+                  'stages': df.astype(object).where(df.notna(), None).to_dict(orient='records')}
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+    def print_summary(self, slowest=5):
+        """print the time and counters of each stage and the slowest satellites"""
+        totals = self.totals()
+        print(f'run took {time.perf_counter() - self._start:.1f}s, peak memory {peak_memory_mb()} MB')
+        for name, stage in totals.iterrows():
+            counters = ' '.join(f'{counter}={int(stage[counter]):,}' for counter in COUNTERS if stage[counter])
+            print(f'  {name:<8} {stage["seconds"]:9.2f}s {counters}')
+        per_sat = self.to_frame().dropna(subset=['sxid']).groupby('sxid')['seconds'].sum().nlargest(slowest)
+        if len(per_sat):
+            print('  slowest satellites: ' + ', '.join(f'{sxid} ({seconds:.1f}s)' for sxid, seconds in per_sat.items()))
+
+
+# time a stage of the pipeline and collect its counters into the active run report; does nothing without one
+# the record also gets the process peak memory when the stage ends (see peak_memory_mb)
+@contextmanager
+def stage(name, sxid=None):
+    report = _report.get()
+    if report is None:
+        yield None
+        return
+
+    record = {'sxid': None if sxid is None else str(sxid), 'stage': name, **dict.fromkeys(COUNTERS, 0), 'error': None}
+    token = _record.set(record)
+    profile = report.profile_hook(name, sxid) if name in report.profile_stages else nullcontext()
+    start = time.perf_counter()
+    try:
+        with profile:
+            yield record
+    except Exception as e:
+        record['error'] = type(e).__name__
+        raise
+    finally:
+        _record.reset(token)
+        record['seconds'] = round(time.perf_counter() - start, 6)
+        record['peak_memory_mb'] = peak_memory_mb()
+        report.add(record)
+
+
+# add the records of a stage that ran once for a batch of satellites to the active run report: one per satellite, with its rows
+# in counter (if given) and a share of the time in proportion to them; a batch without rows or that failed gets one record without sxid
+def record_batch(name, seconds, rows_by_sxid, counter='sql_rows', error=None):
+    report = _report.get()
+    if report is None:
+        return
+    total = sum(rows_by_sxid.values())
+    if total == 0 or error is not None:
+        rows_by_sxid, total = {None: 0}, 1
+    for sxid, rows in rows_by_sxid.items():
+        record = {'sxid': None if sxid is None else str(sxid), 'stage': name, **dict.fromkeys(COUNTERS, 0), 'error': error,
+                  'seconds': round(seconds * rows / total, 6) if sxid is not None else round(seconds, 6), 'peak_memory_mb': peak_memory_mb()}
+        if counter is not None:
+            record[counter] = int(rows)
+        report.add(record)
+
+
+# run a block under the profiling hook of the active run report if the stage is profiled, without recording it as a stage
+@contextmanager
+def profiled(name, sxid=None):
+    report = _report.get()
+    if report is None or name not in report.profile_stages:
+        yield
+        return
+    with report.profile_hook(name, sxid):
+        yield
+
+
+# add to the counters of the stage that is running, from this thread or a worker submitted with submit()
+def count(**amounts):
+    record = _record.get()
+    if record is None:
+        return
+    with _count_lock:
+        for counter, amount in amounts.items():
+            record[counter] += amount
+
+
+# submit a function to an executor so it runs in the caller's context, keeping its counts in the caller's stage
+def submit(executor, func, *args, **kwargs):
+    return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
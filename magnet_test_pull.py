@@ -1,27 +1,208 @@
 # MAGNET_TEST_PULL.PY
 # pull all magnet test data for a specific list of satellites
 
+import time
+import traceback
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import build_tree as bt
 import output_tables as ot
 import SQL_queries as sq
+import result_store as rs
+import instrumentation as instr
+from pull_state import PullState
+from genealogy_mirror import GenealogyMirror, MIRROR_TABLES
 
 # list of all SXIDs (as strings) that magnet test data needs to be pulled for - change as necessary
 v2_sats_list = ['11072','11075']
 
+# number of satellites pulled at the same time - change as necessary
+MAX_WORKERS = 4
+
+# only pull tests newer than the ones already in output.csv and update their rows in place - change as necessary
+INCREMENTAL = True
+
+# stream the genealogy query in chunks of this many rows, so only the rows and columns the trees use are held, None reads it in one go - change as necessary
+STREAM_CHUNK_SIZE = 50_000
+
+# only fetch the newest test of each magnet type instead of every magnet test document - change as necessary
+LATEST_ONLY = True
+
+# read the genealogy from the local mirror in genealogy_mirror.db, synced with the new ERP rows at the start of each run - change as necessary
+USE_GENEALOGY_MIRROR = False
+
+# also write the rows to the parquet store read by the analysis scripts - change as necessary
+WRITE_STORE = True
+
+# run report with the time, sql rows, http requests and cache hits of every stage of every satellite - change as necessary
+RUN_REPORT_PATH = 'run_report.json'
+
+# stages run under cProfile, their stats are saved to profiles/<stage>_<sxid>.prof - change as necessary
+# stages: sql, status, tree, info, otto, write
+PROFILE_STAGES = []
+
+
+# return all magnet test rows for one satellite, querying its tree unless it was already pulled in a batch
+# with since given (a date, or a {test serial number: date} watermark), only tests completed after it are returned
+# seen gets the newest completion date of the tests of each test serial number queried
+# with cleaned the given tree already has its statuses cleaned, as the trees of a streamed query_trees
+def pull_satellite(engine, sat, magnets_tree=None, since=None, latest_only=LATEST_ONLY, seen=None, cleaned=False):
+    if magnets_tree is None:
+        with instr.stage('sql', sat):
+            magnets_tree = sq.get_full_magnets_tree(engine,str(sat)) # pull full magnets tree for sat
+        cleaned = False
+    if len(magnets_tree) == 0:
+        raise ValueError(f'no genealogy rows for satellite {sat}')
+    if cleaned:
+        cleaned_tree = magnets_tree
+    else:
+        with instr.stage('status', sat):
+            cleaned_tree = ot.create_one_status(magnets_tree) # for components with multiple status with at least 1 Removed, keep only Removed status
+    with instr.stage('tree', sat):
+        tree = bt.compact_tree(sat, cleaned_tree) # format the tree into arrays, leaving out all Removed status nodes
+    with instr.stage('info', sat):
+        rough_table = ot.tree_to_info_output(tree) # list information for each node in the tree
+    with instr.stage('otto', sat):
+        return ot.full_table_to_test_entries(rough_table,sat,since,latest_only,seen) # all magnet test data rows for the sat
+
+
+# pull one satellite and record its rows or the error that stopped it
+# with a PullState only the tests completed after the watermark of their test serial number are queried, and a test is returned
+# unless a newer test of its magnet type was already emitted from a magnet still in the satellite; the new watermarks are kept in the state
+# with full the watermarks are not used and every test is returned
+# cleaned as in pull_satellite
+def pull_satellite_summary(engine, sat, magnets_tree=None, state=None, latest_only=LATEST_ONLY, full=False, cleaned=False):
+    start = time.perf_counter()
+    try:
+        if state is None:
+            rows = pull_satellite(engine, sat, magnets_tree, latest_only=latest_only, cleaned=cleaned)
+        else:
+            seen = {}
+            rows = pull_satellite(engine, sat, magnets_tree, None if full else state.watermarks(sat), latest_only, seen, cleaned)
+            if not full:
+                newest = state.newest_emitted(sat, seen)
+                rows = [row for row in rows if row.get('magnet_type') not in newest or pd.to_datetime(row['date'], utc=True) > newest[row['magnet_type']]]
+            state.see(sat, seen)
+        error = None
+    except Exception as e:
+        rows = []
+        error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+    return rows, {'sxid': sat, 'rows': len(rows), 'seconds': round(time.perf_counter() - start, 3), 'error': error}
+
 
-# connect to server
-engine,db = sq.connect_to_sql_server()
-sq.pn_to_wo_mapping(engine) # create PN to WorkOrderID mapping file
+# query the genealogy of all satellites with one batched query and split it by root SXID, returning {sxid: tree table}
+# with chunksize given the genealogy is streamed and its statuses cleaned chunk by chunk
+# the run report gets one 'sql' record per satellite with its rows, and the cleanup of the streamed chunks is timed as 'status'
+def query_trees(engine, sats, chunksize=STREAM_CHUNK_SIZE, tables=sq.ERP_TABLES):
+    start = time.perf_counter()
+    fetch = {'seconds': 0.0}
+    sql_rows = collections.Counter()
 
+    def read(query): # time the waits for the server apart from the status cleanup the chunks go through
+        fetch_start = time.perf_counter()
+        chunks = iter(query())
+        fetch['seconds'] += time.perf_counter() - fetch_start
+        while True:
+            fetch_start = time.perf_counter()
+            chunk = next(chunks, None)
+            fetch['seconds'] += time.perf_counter() - fetch_start
+            if chunk is None:
+                return
+            sql_rows.update(chunk['RootSN'].astype(str).value_counts().to_dict())
+            yield chunk
 
-# add all magnet test data to output.csv for each sat in the list
-for sat in v2_sats_list:
     try:
-        magnets_tree = sq.get_full_magnets_tree(engine,str(sat)) # pull full magnets tree for sat
-        cleaned_tree = ot.create_one_status(magnets_tree) # for components with multiple status with at least 1 Removed, keep only Removed status
-        G = bt.add_to_table(sat, cleaned_tree) # format the tree into a networkx graph and take out all Removed status nodes
-        rough_table = ot.graph_to_info_output(G) # list information for each node in the tree
-        ot.full_table_to_tests(rough_table,sat) # output all magnet test data into output.csv
-    except:
-        continue
+        with instr.profiled('sql'):
+            if chunksize is not None:
+                chunks = read(lambda: sq.get_full_magnets_trees(engine, sats, tables=tables, chunksize=chunksize))
+                all_trees = ot.create_one_status_chunks(chunks, columns=['RootSN', *bt.TREE_COLUMNS])
+            else: # the statuses are cleaned per satellite in pull_satellite
+                all_trees, = read(lambda: [sq.get_full_magnets_trees(engine, sats, tables=tables)])
+            trees = {str(sat): tree.drop(columns='RootSN') for sat, tree in all_trees.groupby('RootSN')}
+    except Exception as e:
+        instr.record_batch('sql', time.perf_counter() - start, sql_rows, error=type(e).__name__)
+        raise
+
+    instr.record_batch('sql', fetch['seconds'], sql_rows)
+    if chunksize is not None:
+        instr.record_batch('status', time.perf_counter() - start - fetch['seconds'], sql_rows, counter=None)
+    return trees
+
+
+# pull all satellites with a pool of workers, returning every row (in satellite order) and a per-satellite summary table
+# the genealogy of all satellites is pulled with one batched query (see query_trees); if it fails, every satellite reports the error
+# with a PullState only the tests newer than the watermarks of their test serial numbers are queried (see pull_satellite_summary)
+# with full every test is pulled and only the new watermarks are kept in the state
+# with latest_only only the newest test of each magnet type is fetched for every satellite
+# tables names the genealogy tables, e.g. MIRROR_TABLES with a connection to the local genealogy mirror as engine
+def pull_satellites(engine, sats, max_workers=MAX_WORKERS, state=None, chunksize=STREAM_CHUNK_SIZE, latest_only=LATEST_ONLY, tables=sq.ERP_TABLES, full=False):
+    start = time.perf_counter()
+    try:
+        trees = query_trees(engine, sats, chunksize, tables)
+    except Exception as e:
+        error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        seconds = round(time.perf_counter() - start, 3)
+        return [], pd.DataFrame([{'sxid': sat, 'rows': 0, 'seconds': seconds, 'error': error} for sat in sats])
+    empty_tree = pd.DataFrame(columns=bt.TREE_COLUMNS) # satellites the query returned no rows for fail in pull_satellite
+    cleaned = chunksize is not None # the streamed trees had their statuses cleaned by query_trees
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sat') as executor:
+        futures = [instr.submit(executor, pull_satellite_summary, engine, sat, trees.get(str(sat), empty_tree), state, latest_only, full, cleaned)
+                   for sat in sats]
+        outputs = [future.result() for future in futures]
+
+    rows = [row for sat_rows, _ in outputs for row in sat_rows]
+    summary = pd.DataFrame([sat_summary for _, sat_summary in outputs])
+    return rows, summary
+
+
+# print how many satellites were pulled and why the others failed
+def print_summary(summary):
+    failed = summary[summary['error'].notna()]
+    print(f"pulled {len(summary) - len(failed)}/{len(summary)} satellites, {summary['rows'].sum()} test rows")
+    for _, sat in failed.iterrows():
+        print(f"  {sat['sxid']} failed: {sat['error']}")
+
+
+# pull the magnet test data of every satellite and write it to output.csv (and the parquet store), with a run report
+def main(sats=v2_sats_list, incremental=INCREMENTAL, write_store=WRITE_STORE, use_mirror=USE_GENEALOGY_MIRROR, max_workers=MAX_WORKERS,
+         latest_only=LATEST_ONLY, profile_stages=PROFILE_STAGES, report_path=RUN_REPORT_PATH):
+    report = instr.RunReport(profile_stages)
+    with report:
+        # connect to server
+        engine,db = sq.connect_to_sql_server()
+        with instr.stage('sql'):
+            sq.pn_to_wo_mapping(engine) # create PN to WorkOrderID mapping file
+
+        genealogy, tables = engine, sq.ERP_TABLES
+        if use_mirror:
+            mirror = GenealogyMirror()
+            with instr.stage('sql'):
+                mirror.sync(engine) # copy the genealogy rows added since the last run
+            genealogy, tables = mirror.connect(), MIRROR_TABLES
+
+        # pull all sats in parallel, then add all magnet test data to output.csv with a single write
+        state = PullState()
+        rows, summary = pull_satellites(genealogy, sats, max_workers, state=state, latest_only=latest_only, tables=tables, full=not incremental)
+        with instr.stage('write'):
+            if incremental:
+                ot.upsert_test_rows(rows) # replace the rows of the same tests or magnet types
+            else:
+                pulled = summary.loc[summary['error'].isna(), 'sxid']
+                ot.replace_satellite_rows(rows, pulled) # the rows of every satellite pulled are rewritten, failed satellites keep theirs
+                state.reset(pulled)
+            state.record(rows) # with the watermarks of the satellites pulled
+        state.close()
+        if write_store:
+            with instr.stage('write'):
+                rs.write_results(rows) # each sxid/magnet_type partition written is replaced with its new row
+    print_summary(summary)
+    report.write(report_path)
+    report.print_summary()
+    return summary
+
+
+if __name__ == '__main__':
+    main()
@@ -4,23 +4,24 @@ import matplotlib.pyplot as plt
 import math
 from matplotlib.lines import Line2D
 import collections
-import addcopyfighandler
+import sum_curve as sc
 
-df = pd.read_csv('test_CORRECT.csv')
+# sxids of the satellites classified as mode shifters, loaded by main
+mode_shifters = []
 
-ms = pd.read_csv('classified_CORRECT.csv')
-ms = ms[ms['mode_shifters'] == 'y']
-mode_shifters = list(ms['sxid'])
+deg_list = range(0,361,12)
 
-inner = df[df['magnet_type'] == 'inner']
-outer = df[df['magnet_type'] == 'outer']
-combined = df[df['magnet_type'] == 'combined']
 
-inner['pp'] = inner['Maximum Magnetic Flux Density'] - inner['Minimum Magnetic Flux Density']
-outer['pp'] = outer['Maximum Magnetic Flux Density'] - outer['Minimum Magnetic Flux Density']
-combined['pp'] = combined['Maximum Magnetic Flux Density'] - combined['Minimum Magnetic Flux Density']
+# split the magnet test table into its inner, outer and combined scans, with the peak to peak flux of each scan
+def split_magnet_types(df):
+    inner = df[df['magnet_type'] == 'inner'].copy()
+    outer = df[df['magnet_type'] == 'outer'].copy()
+    combined = df[df['magnet_type'] == 'combined'].copy()
 
-deg_list = range(0,361,12)
+    inner['pp'] = inner['Maximum Magnetic Flux Density'] - inner['Minimum Magnetic Flux Density']
+    outer['pp'] = outer['Maximum Magnetic Flux Density'] - outer['Minimum Magnetic Flux Density']
+    combined['pp'] = combined['Maximum Magnetic Flux Density'] - combined['Minimum Magnetic Flux Density']
+    return inner, outer, combined
 
 # generate plots of superimposed traces
 def superimposed_traces(df):
@@ -43,7 +44,7 @@ def superimposed_traces(df):
 
     plt.xlabel('Azimuth Position (deg)')
     plt.ylabel('Magnetic Flux Density (Gauss)')
-    plt.title(f'{df['magnet_type'].iloc[0]} Magnet Measurements Superimposed'.title())
+    plt.title(f'{df["magnet_type"].iloc[0]} Magnet Measurements Superimposed'.title())
     plt.grid(True)
     line5 = Line2D([0], [0], label='Non-mode shifters', color='blue')
     line6 = Line2D([0], [0], label='Mode shifters', color='orange')
@@ -58,9 +59,9 @@ def output_histo(df,metric):
     plt.figure(figsize=(10, 6))
     plt.hist(df_nonms[metric], bins=20,range=(int(min(df_nonms[metric])), math.ceil(max(df_nonms[metric])) + 1), color='blue', edgecolor='black',label='Non-mode shifters')
     plt.hist(df_ms[metric], bins=20,range=(int(min(df_ms[metric])), math.ceil(max(df_ms[metric])) + 1), color = 'orange', edgecolor='black',label='Mode shifters')
-    plt.xlabel(f'{df['magnet_type'].iloc[0]} Magnet {metric} (Gauss)'.title())
+    plt.xlabel(f'{df["magnet_type"].iloc[0]} Magnet {metric} (Gauss)'.title())
     plt.ylabel('Count of Satellites')
-    plt.title(f'Histogram of {df['magnet_type'].iloc[0]} Magnet {metric}'.title())
+    plt.title(f'Histogram of {df["magnet_type"].iloc[0]} Magnet {metric}'.title())
     plt.legend()
     plt.show()
 
@@ -150,40 +151,9 @@ def assembled_curve(df,sat):
     plt.close()
 
 
-# generate the predicted axial curve and graph it
-def find_closest_sum_curve(df,sat):
-    df = df[df['sxid'] == sat]
+# graph the predicted axial curve of a satellite against its combined curve
+def plot_sum_curve(sat,min_list,combined_pt_list,min_diff):
     deg_list = range(0,361,12)
-    if len(df['sxid']) != 3:
-        return
-    
-    for i in range(len(df['sxid'])):
-        if df['magnet_type'].iloc[i] == 'inner':
-            inner_pt_list = np.array(find_pt_list(df,i))
-            inner_min = np.argmin(inner_pt_list)
-            inner_pt_list = np.roll(inner_pt_list,-inner_min)
-        elif df['magnet_type'].iloc[i] == 'outer':
-            outer_pt_list = np.array(find_pt_list(df,i))
-            outer_max = np.argmax(outer_pt_list)
-            outer_pt_list = np.roll(outer_pt_list,-outer_max)
-        else:
-            combined_pt_list = np.array(find_pt_list(df,i))
-
-    difflist = np.array([inner_pt_list[i] + outer_pt_list[i] for i in range(len(inner_pt_list))])
-
-    diff = difflist - combined_pt_list
-    squared_residuals = diff ** 2
-    min_diff = np.sum(squared_residuals)
-    min_list = difflist
-
-    for i in range(len(deg_list)-1):
-        difflist = np.roll(difflist,1)
-        diff = difflist - combined_pt_list
-        squared_residuals = diff ** 2
-        if np.sum(squared_residuals) < min_diff:
-            min_diff = np.sum(squared_residuals)
-            min_list = difflist
-
 
     fig,ax1 = plt.subplots(figsize=(10,8))
     ax1.set_xlabel('Azimuth Position (deg)')
@@ -213,14 +183,62 @@ def find_closest_sum_curve(df,sat):
         plt.savefig(f'sum_curves/non_mode_shifters/sat{sat}')
     plt.close()
 
-# superimposed_traces(inner)
-# superimposed_traces(outer)
-# superimposed_traces(combined)
 
-output_histo(inner,'pp')
-output_histo(outer,'pp')
-output_histo(combined,'pp')
+# generate the predicted axial curve and graph it
+def find_closest_sum_curve(df,sat):
+    sats, inner, outer, combined = sc.fleet_matrices(df[df['sxid'] == sat])
+    if len(sats) == 0:
+        return
+    aligned, residuals, shifts = sc.align_sum_curves(inner, outer, combined)
+    plot_sum_curve(sat, aligned[0], combined[0], residuals[0])
+
+
+# generate and graph the predicted axial curves of every satellite, aligning all of them at once
+def plot_fleet_sum_curves(df):
+    plot_sum_curves(*sc.fleet_matrices(df))
+
+
+# same as plot_fleet_sum_curves for the satellites and scan matrices of sum_curve.fleet_matrices or sum_curve.store_matrices
+def plot_sum_curves(sats, inner, outer, combined):
+    aligned, residuals, shifts = sc.align_sum_curves(inner, outer, combined)
+    for sat, min_list, combined_pt_list, min_diff in zip(sats, aligned, combined, residuals):
+        plot_sum_curve(sat, min_list, combined_pt_list, min_diff)
+
+
+# show the histograms of the scans, or with sum_curves save the sum curve figure of every satellite
+# with store_path the columns used are read from the parquet result store instead of the test table
+def main(test_path='test_CORRECT.csv', classified_path='classified_CORRECT.csv', sum_curves=False, store_path=None):
+    global mode_shifters
+    mode_shifters = sc.load_mode_shifters(classified_path)
+    if sum_curves:
+        if store_path is not None:
+            plot_sum_curves(*sc.store_matrices(store_path))
+        else:
+            plot_fleet_sum_curves(pd.read_csv(test_path))
+        return
+
+    if store_path is not None:
+        import result_store as rs
+        df = rs.read_results(store_path, columns=['sxid', 'magnet_type', 'Maximum Magnetic Flux Density', 'Minimum Magnetic Flux Density'])
+        df['sxid'] = sc.csv_sxids(df['sxid'])
+    else:
+        df = pd.read_csv(test_path)
+    inner, outer, combined = split_magnet_types(df)
+
+    # superimposed_traces(inner)
+    # superimposed_traces(outer)
+    # superimposed_traces(combined)
+
+    output_histo(inner,'pp')
+    output_histo(outer,'pp')
+    output_histo(combined,'pp')
+
+    output_histo(inner,'Minimum Magnetic Flux Density')
+    output_histo(outer, 'Minimum Magnetic Flux Density')
+    output_histo(combined, 'Minimum Magnetic Flux Density')
+
+
+if __name__ == '__main__':
+    import addcopyfighandler # copy figures to the clipboard with ctrl+c
+    main()
 
-output_histo(inner,'Minimum Magnetic Flux Density')
-output_histo(outer, 'Minimum Magnetic Flux Density')
-output_histo(combined, 'Minimum Magnetic Flux Density')
@@ -1,57 +1,173 @@
 # OTTO_TESTS.PY
 # all relevant functions to query magnet tests from otto results database
 
+import json
+import math
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrumentation as instr
+from document_cache import DocumentCache
 
 DEFAULT_HOST_LOCATION = 'https://otto-results.spacex.corp'
 DEFAULT_API_PATH = '/api/v1/'
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_RETRIES = 3
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_PAGES_AHEAD = 2
+
+
+# create a keep-alive session with a connection pool sized for the fetch workers that retries transient failures
+def make_session(pool_size=DEFAULT_MAX_WORKERS, retries=DEFAULT_RETRIES):
+    """
+    Return a requests.Session shared by all queries of an OttoQuery
+    Args:
+        pool_size(int): number of connections kept open per host
+        retries(int): number of retries on connection errors and 429/5xx responses
+    """
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset(['GET']), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 
 # query a request from the database
-def query(host, path, query_string):
+def query(host, path, query_string, session=None):
     """query the database"""
+    return json.loads(query_raw(host, path, query_string, session))
+
+
+# query a request from the database and return the undecoded response body
+def query_raw(host, path, query_string, session=None):
+    """query the database, returning the json body as bytes"""
     url = "{}{}{}".format(host, path, query_string)
-    return requests.get(url).json()
+    content = (session or requests).get(url).content
+    instr.count(http_requests=1, http_bytes=len(content))
+    return content
 
 
 # return a result for a query
-def grab_document(host, path, case_id):
+def grab_document(host, path, case_id, session=None, cache=None):
     """
     Return a Result object
     Args:
         host: host of database
         path: api path
         case_id(string): identifier for the testcase you are parsing. EG: '98df0ff4-6256-4a2a-b193-fce64cb6ccf1'
+        session: optional requests.Session to reuse pooled connections
+        cache: optional DocumentCache checked before the database is queried
     """
-    return Result(case_id=case_id, db_dict=query(host, path, "documents/{}".format(case_id)))
+    raw = cache.get_raw(case_id) if cache is not None else None
+    if raw is not None:
+        instr.count(cache_hits=1)
+        return Result.from_raw(case_id, raw)
+    if cache is not None:
+        instr.count(cache_misses=1)
+
+    raw = query_raw(host, path, "documents/{}".format(case_id), session)
+    result = Result.from_raw(case_id, raw)
+    if cache is not None:
+        cache.put_raw(case_id, raw, completed=bool(result.date))
+    return result
 
 
 # result class that stores information for a test
 class Result(object):
-    """Structure of a testcase result as stored in the database"""
+    """
+    Structure of a testcase result as stored in the database
+    Only the scalar fields and reference/link lookups are kept decoded, the rest of the document stays as its json
+    bytes until one of its sections (steps, measurements...) is first accessed; the decoded sections then replace the bytes.
+    """
+
+    __slots__ = ('case_id', 'otto', 'date', 'description', 'name', 'outcome', 'production_test', 'started',
+                 'test_system', 'document_uuid', 'version', '_raw', '_decoded', '_references', '_links')
 
-    def __init__(self, case_id, db_dict, host_location=DEFAULT_HOST_LOCATION):
-        """input a dictionary that is a result of querying the database for a document"""
+    # sections of the document kept as json until they are accessed
+    _SECTIONS = ('links', 'measurements', 'references', 'requirements', 'rules', 'steps', 'tags', 'tools')
+
+    def __init__(self, case_id, db_dict, host_location=DEFAULT_HOST_LOCATION, raw=None):
+        """input a dictionary that is a result of querying the database for a document, and optionally its json bytes"""
         self.case_id = case_id
         self.otto = '{}/report/{}'.format(host_location, case_id)
         self.date = db_dict['completed']
         self.description = db_dict['description']
-        self.links = db_dict['links']
-        self.measurements = db_dict['measurements']
         self.name = db_dict['name']
         self.outcome = db_dict['outcome']
         self.production_test = db_dict['production_test']
-        self.references = db_dict['references']
-        self.requirements = db_dict['requirements']
-        self.rules = db_dict['rules']
         self.started = db_dict['started']
-        self.steps = db_dict['steps']
-        self.tags = db_dict['tags']
         self.test_system = db_dict['test_system']
-        self.tools = db_dict['tools']
         self.document_uuid = db_dict['uuid']
         self.version = db_dict['version']
+        missing = [section for section in self._SECTIONS if section not in db_dict]
+        if missing:
+            raise KeyError(missing[0]) # malformed document, as when every section was read here
+        self._raw = raw if raw is not None else json.dumps(db_dict, separators=(',', ':')).encode()
+        self._decoded = None
+        self._references = self._first_values(db_dict['references'], 'ref_type', 'ref_id')
+        self._links = self._first_values(db_dict['links'], 'name', 'path')
+
+    @classmethod
+    def from_raw(cls, case_id, raw, host_location=DEFAULT_HOST_LOCATION):
+        """build a Result from the json bytes of a document"""
+        return cls(case_id, json.loads(raw), host_location, raw=raw)
+
+    @staticmethod
+    def _first_values(structure, key_id, value_id):
+        """lookup of the first value for each key, the same item _loop_first would find"""
+        values = {}
+        for item in structure:
+            if key_id in item and value_id in item:
+                values.setdefault(item[key_id], item[value_id])
+        return values
+
+    def _section(self, section):
+        """return one section of the stored document, whose sections are decoded on the first access and kept instead of its bytes"""
+        if self._decoded is None:
+            document = json.loads(self._raw)
+            self._decoded = {name: document[name] for name in self._SECTIONS}
+            self._raw = None
+        return self._decoded[section]
+
+    @property
+    def links(self):
+        return self._section('links')
+
+    @property
+    def measurements(self):
+        return self._section('measurements')
+
+    @property
+    def references(self):
+        return self._section('references')
+
+    @property
+    def requirements(self):
+        return self._section('requirements')
+
+    @property
+    def rules(self):
+        return self._section('rules')
+
+    @property
+    def steps(self):
+        return self._section('steps')
+
+    @property
+    def tags(self):
+        return self._section('tags')
+
+    @property
+    def tools(self):
+        return self._section('tools')
 
     def __str__(self):
         return "\nCASE ID: %s\nProduction Test: %s\nLINK: %s\nOUTCOME: %s\n" % (self.case_id, self.name, self.otto_link, self.outcome)
@@ -67,86 +183,237 @@ class Result(object):
     @property
     def issue_ticket(self):
         """Return a borg link"""
-        return self._loop_first(self.links, 'name', 'issue_ticket', 'path')
+        return self._links.get('issue_ticket', '')
     
     @property
     def otto_link(self):
         """Return a borg link"""
-        return self._loop_first(self.links, 'name', 'otto_results', 'path')
+        return self._links.get('otto_results', '')
     
     @property
     def borg(self):
         """Return a otto db link"""
         return 'https://borg.spacex.corp/runs/{}'.format(
-            self._loop_first(self.links, 'name', 'borg_run_id', 'path'))
+            self._links.get('borg_run_id', ''))
 
     @property
     def pcba_uuid(self):
         """Return the units pcba uuid"""
-        return self._loop_first(self.references, 'ref_type', 'pcba_uuid', 'ref_id')
+        return self._references.get('pcba_uuid', '')
 
     @property
     def campaign_id(self):
         """Return the campaign id"""
-        return self._loop_first(self.references, 'ref_type', 'campaign_id', 'ref_id')
+        return self._references.get('campaign_id', '')
 
     @property
     def user(self):
         """Return running user"""
-        return self._loop_first(self.references, 'ref_type', 'borg_user', 'ref_id')
+        return self._references.get('borg_user', '')
 
     @property
     def slot(self):
         """Return running slot"""
-        return self._loop_first(self.references, 'ref_type', 'slot_number', 'ref_id')
+        return self._references.get('slot_number', '')
 
     @property
     def sn(self):
         """Return serial number"""
-        return self._loop_first(self.references, 'ref_type', 'serial_number', 'ref_id')
+        return self._references.get('serial_number', '')
     
     @property
     def pn(self):
         """Return serial number"""
-        return self._loop_first(self.references, 'ref_type', 'part_number', 'ref_id')
+        return self._references.get('part_number', '')
     
     @property
     def workorder(self):
         """Return serial number"""
-        return self._loop_first(self.references, 'ref_type', 'warp_workorder', 'ref_id')
+        return self._references.get('warp_workorder', '')
 
 
 # otto query class that is used to query the database
 class OttoQuery(object):
     """helper to query otto-results"""
 
-    def __init__(self, host_location=None, api_path=None):
+    def __init__(self, host_location=None, api_path=None, max_workers=1, session=None, cache=None):
+        """
+        Args:
+            host_location: host of database
+            api_path: api path
+            max_workers(int): number of documents fetched concurrently, 1 fetches them one at a time
+            session: requests.Session to share, a pooled session with retries is made if not given
+            cache: optional DocumentCache for completed documents
+        """
         self.host = host_location or DEFAULT_HOST_LOCATION
         self.path = api_path or DEFAULT_API_PATH
+        self.max_workers = max_workers
+        self.session = session or make_session(pool_size=max(max_workers, 1))
+        self.cache = cache
+        self._executor = None
+        self._executor_lock = threading.Lock()
 
     def _query(self, query_string):
-        return query(self.host, self.path, query_string)
+        return query(self.host, self.path, query_string, self.session)
+
+    def _pool(self):
+        """thread pool shared by every fetch of this query object, so concurrency stays bounded across callers"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='otto')
+            return self._executor
+
+    def _grab(self, result_pointer):
+        """fetch the document for a result pointer, None if the pointer or document is malformed"""
+        try:
+            return grab_document(self.host, self.path, case_id=result_pointer['case_id'], session=self.session, cache=self.cache)
+        except KeyError:
+            return None
+
+    def grab_documents(self, result_pointers):
+        """fetch the documents for a list of result pointers, keeping the pointer order"""
+        if self.max_workers > 1:
+            futures = [instr.submit(self._pool(), self._grab, result_pointer) for result_pointer in result_pointers]
+            documents = (future.result() for future in futures)
+        else:
+            documents = map(self._grab, result_pointers)
+        return [document for document in documents if document is not None]
+
+    def iter_documents(self, result_pointers):
+        """
+        Yield the documents of a stream of result pointers in pointer order, None for malformed ones
+        At most 2 * max_workers documents are requested ahead of the one being yielded, so memory stays bounded
+        """
+        if self.max_workers <= 1:
+            yield from map(self._grab, result_pointers)
+            return
+
+        pending = deque()
+        try:
+            for result_pointer in result_pointers:
+                pending.append(instr.submit(self._pool(), self._grab, result_pointer))
+                if len(pending) >= 2 * self.max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending: # the consumer stopped early, drop the fetches that have not started
+                future.cancel()
+
+    def iter_pointers(self, query_string, page_size=DEFAULT_PAGE_SIZE, pages_ahead=DEFAULT_PAGES_AHEAD):
+        """
+        Yield the result pointers of a references query page by page
+        A pointer whose case_id was already yielded is skipped, and paging stops at a page that repeats the previous one,
+        so an api that ignores page= or results added while paging do not duplicate pointers or loop
+        Args:
+            query_string(string): references query
+            page_size(int): pointers per page
+            pages_ahead(int): number of later pages requested in the background while a page is consumed
+        """
+        first_page = self._query(f'{query_string}&page=1&items_per_page={page_size}')
+        n_pages = math.ceil(first_page['total_items'] / page_size)
+        pages = deque()
+        next_page = 2
+
+        def request_pages():
+            nonlocal next_page
+            while next_page <= n_pages and (len(pages) < pages_ahead or len(pages) == 0):
+                page_query = f'{query_string}&page={next_page}&items_per_page={page_size}'
+                pages.append(instr.submit(self._pool(), self._query, page_query) if self.max_workers > 1 else page_query)
+                next_page += 1
+
+        seen = set()
+
+        def new_items(items):
+            for result_pointer in items:
+                case_id = result_pointer.get('case_id')
+                if case_id is not None:
+                    if case_id in seen:
+                        continue
+                    seen.add(case_id)
+                yield result_pointer
+
+        try:
+            request_pages()
+            previous = first_page['items']
+            yield from new_items(previous)
+            while pages:
+                page = pages.popleft()
+                page = page.result() if isinstance(page, Future) else self._query(page)
+                request_pages()
+                if len(page['items']) == 0 or page['items'] == previous:
+                    break
+                previous = page['items']
+                yield from new_items(previous)
+        finally:
+            for page in pages:
+                if isinstance(page, Future):
+                    page.cancel()
+
+    @staticmethod
+    def _after(result_pointers, since):
+        """drop the pointers that carry a completion date at or before since"""
+        for result_pointer in result_pointers:
+            if not result_pointer.get('completed') or pd.to_datetime(result_pointer['completed']) > since:
+                yield result_pointer
+
+    def iter_results_by_reference(self, query_string, page_size=DEFAULT_PAGE_SIZE, pages_ahead=DEFAULT_PAGES_AHEAD, since=None, pointer_filter=None):
+        """
+        Yield the Results of a references query in pointer order, starting before all pointer pages have arrived
+        Args:
+            query_string(string): references query
+            page_size(int): pointers per page
+            pages_ahead(int): number of later pages requested in the background
+            since: only yield results completed after this date, pointers that carry an older date are not fetched
+            pointer_filter: function of a result pointer, documents are only fetched for pointers it returns True for
+        """
+        result_pointers = self.iter_pointers(query_string, page_size, pages_ahead)
+        if pointer_filter is not None:
+            result_pointers = filter(pointer_filter, result_pointers)
+        if since is not None:
+            since = pd.to_datetime(since)
+            result_pointers = self._after(result_pointers, since)
+
+        for result in self.iter_documents(result_pointers):
+            if result is None or (since is not None and pd.to_datetime(result.date) <= since):
+                continue
+            yield result
+
+    def get_results_by_reference(self, query_string, sort_by=None, since=None, page_size=DEFAULT_PAGE_SIZE, pointer_filter=None):
+        """
+        query the database
+        Args:
+            query_string(string): references query
+            sort_by(string): Result attribute to sort by, newest/largest first
+            since: only return results completed after this date, pointers that carry an older date are not fetched
+            page_size(int): pointers per page, None asks for all pointers in a single page
+            pointer_filter: function of a result pointer, documents are only fetched for pointers it returns True for
+        """
+        if page_size is not None:
+            results = list(self.iter_results_by_reference(query_string, page_size=page_size, since=since, pointer_filter=pointer_filter))
+        else:
+            total_items = self._query(f'{query_string}&items_per_page=1')['total_items']
+            result_pointers = self._query(f'{query_string}&items_per_page={total_items}')['items']
 
-    def get_results_by_reference(self, query_string, sort_by=None):
-        """query the database"""
-        results = []
+            if pointer_filter is not None:
+                result_pointers = list(filter(pointer_filter, result_pointers))
 
-        total_items = self._query(f'{query_string}&items_per_page=1')['total_items']
-        result_pointers = self._query(f'{query_string}&items_per_page={total_items}')
+            if since is not None:
+                since = pd.to_datetime(since)
+                result_pointers = list(self._after(result_pointers, since))
 
-        for result_pointer in result_pointers['items']:
-            try:
-                results.append(grab_document(self.host, self.path, case_id=result_pointer['case_id']))
-            except KeyError:
-                pass
+            results = self.grab_documents(result_pointers)
+
+            if since is not None:
+                results = [result for result in results if pd.to_datetime(result.date) > since]
 
         if sort_by:
             results = sorted(results, key=lambda i: i.__getattribute__(sort_by), reverse=True)
         return results
 
-    def sn_results(self, *serial_numbers):
+    def sn_results(self, *serial_numbers, **kwargs):
         """Get all results with the serial number"""
-        return self._results(*serial_numbers, ref_type='serial_number')
+        return self._results(*serial_numbers, ref_type='serial_number', **kwargs)
 
     def pcba_uuid_results(self, *pcba_uuid):
         """Get all results with the pcba_uuid"""
@@ -156,60 +423,172 @@ class OttoQuery(object):
         """Get all results with a reference value equal to the the input"""
         return self._results(*search_value)
 
+    @staticmethod
+    def reference_query(*values: str, ref_type=None):
+        """return the references query string for the values, optionally of one reference type"""
+        if ref_type is not None:
+            query_url = 'references?reference_type={}'.format(ref_type)
+        else:
+            # Flask won't care that an ampersand follows a question mark
+            query_url = 'references?'
+
+        for val in values:
+            query_url = query_url + '&reference_value={}'.format(val)
+        return query_url
+
     def _results(self, *values: str, **kwargs):
         """
 
         kwargs:
           ref_type: str  the reference type
           sort_by:  str  the sort by or 'date' default
+          since:    only results completed after this date
+          page_size: pointers per page, None for a single page
+          pointer_filter: only fetch the documents of the pointers this function returns True for
         """
-        if 'ref_type' in kwargs:
-            query_url = 'references?reference_type={}'.format(kwargs['ref_type'])
-        else:
-            # Flask won't care that an ampersand follows a question mark
-            query_url = 'references?'
+        query_url = self.reference_query(*values, ref_type=kwargs.get('ref_type'))
+        return self.get_results_by_reference(query_url, sort_by=kwargs.get('sort_by', 'date'), since=kwargs.get('since'),
+                                             page_size=kwargs.get('page_size', DEFAULT_PAGE_SIZE), pointer_filter=kwargs.get('pointer_filter'))
 
-        for val in values:
-            query_url = query_url + '&reference_value={}'.format(val)
 
-        return self.get_results_by_reference(query_url, sort_by=kwargs.get('sort_by', 'date'))
 
+# query to otto results database, created by get_otto the first time it is needed; assign an OttoQuery to use another one
+otto = None
+_otto_lock = threading.Lock()
+
+
+# return the shared otto query, creating the default one on first use
+def get_otto():
+    global otto
+    with _otto_lock:
+        if otto is None:
+            otto = OttoQuery(DEFAULT_HOST_LOCATION, DEFAULT_API_PATH, max_workers=DEFAULT_MAX_WORKERS, cache=DocumentCache())
+        return otto
+
+
+# return a result pointer filter that only keeps pointers that can be passing magnet tests of one of the part numbers
+# a field the pointer does not carry does not exclude it, the full document is then checked as before
+def magnet_pointer_filter(part_numbers):
+    def keep(result_pointer):
+        name = result_pointer.get('name')
+        if name is not None and 'magnet' not in name:
+            return False
+        outcome = result_pointer.get('outcome')
+        if outcome is not None and outcome != 'pass':
+            return False
+        pn = result_pointer.get('part_number')
+        if pn is not None and not any(elem in pn for elem in part_numbers):
+            return False
+        return True
+    return keep
+
+
+# return the since date of one test serial number, since being one date for all of them or a {test serial number: date} watermark
+def sn_since(since, test_id):
+    return since.get(test_id) if isinstance(since, dict) else since
 
 
-# query to otto results database
-otto = OttoQuery(DEFAULT_HOST_LOCATION, DEFAULT_API_PATH)
+# keep the newest completion date met for each test serial number in seen, a test serial number queried without a date is added as None
+def note_seen(seen, test_id, date=None):
+    if seen is None:
+        return
+    newest = seen.get(test_id)
+    if newest is None or (date and pd.to_datetime(date) > pd.to_datetime(newest)):
+        seen[test_id] = date or newest
 
 
 # find all magnet tests that correspond to a list of test serial numbers that correspond to specific part numbers
-def find_magnet_test_groups(snpndict):
+# if since is given (a date, or a date per test serial number) only tests completed after it are returned
+# seen is filled with the newest completion date of the tests of every test serial number queried
+def find_magnet_test_groups(snpndict, since=None, seen=None):
     radial_tests = []
     axial_inner_tests = []
     axial_outer_tests = []
 
+    groups = {'radial': radial_tests, 'inner': axial_inner_tests, 'outer': axial_outer_tests}
+
     for test_id in snpndict.keys():
-        for result in otto.sn_results(test_id):
-            if 'magnet' in result.name and result.outcome == 'pass' and any(elem in result.pn for elem in snpndict[test_id]):
-
-                if 'Radial' in result.name:
-                    radial_tests.append(result)
-
-                elif 'Axial' in result.name:
-                    for i in result.steps:
-                        if 'against expected properties' in i['description']:
-                            for entry in i['measurements']:
-                                if entry[1]['name'] == 'Average Magnetic Flux': # determine whether axial test is for the inner or outer magnets since inner magnets have higher flux
-                                    if entry[1]['value'] < 700:
-                                        axial_outer_tests.append(result)
-                                    else:
-                                        axial_inner_tests.append(result)
-                                    break
+        if len(snpndict[test_id]) == 0: # no part number to match, none of its tests can be kept
+            continue
+        note_seen(seen, test_id)
+        for result in get_otto().sn_results(test_id, since=sn_since(since, test_id), pointer_filter=magnet_pointer_filter(snpndict[test_id])):
+            note_seen(seen, test_id, result.date)
+            for group in magnet_test_groups(result, snpndict[test_id]):
+                groups[group].append(result)
 
     return radial_tests,axial_inner_tests,axial_outer_tests
 
 
+# return the groups ('radial', 'inner', 'outer') a test is added to if it is a passing magnet test of one of the part numbers
+def magnet_test_groups(result, part_numbers):
+    groups = []
+    if 'magnet' in result.name and result.outcome == 'pass' and any(elem in result.pn for elem in part_numbers):
+
+        if 'Radial' in result.name:
+            groups.append('radial')
+
+        elif 'Axial' in result.name:
+            for i in result.steps:
+                if 'against expected properties' in i['description']:
+                    for entry in i['measurements']:
+                        if entry[1]['name'] == 'Average Magnetic Flux': # determine whether axial test is for the inner or outer magnets since inner magnets have higher flux
+                            if entry[1]['value'] < 700:
+                                groups.append('outer')
+                            else:
+                                groups.append('inner')
+                            break
+
+    return groups
+
+
+# find the latest radial, inner axial and outer axial tests by fetching documents newest first and stopping once all three are found
+# since and seen as in find_magnet_test_groups, seen gets the newest completion date of the pointers of each test serial number
+# returns None if the result pointers carry no completion dates to order them by
+def find_newest_magnet_tests(snpndict, since=None, seen=None):
+    otto = get_otto()
+    result_pointers = []
+    for test_id in snpndict.keys():
+        if len(snpndict[test_id]) == 0:
+            continue
+        keep = magnet_pointer_filter(snpndict[test_id])
+        note_seen(seen, test_id)
+        for result_pointer in otto.iter_pointers(otto.reference_query(test_id, ref_type='serial_number')):
+            note_seen(seen, test_id, result_pointer.get('completed'))
+            if keep(result_pointer):
+                result_pointers.append((result_pointer, snpndict[test_id], sn_since(since, test_id)))
+
+    if any(not result_pointer.get('completed') for result_pointer, _, _ in result_pointers):
+        return None
+    result_pointers = [(p, pns, after) for p, pns, after in result_pointers if after is None or pd.to_datetime(p['completed']) > pd.to_datetime(after)]
+    # newest first; the sort is stable so equal dates keep the order find_latest_magnet_tests would meet them in
+    result_pointers.sort(key=lambda item: pd.to_datetime(item[0]['completed']), reverse=True)
+
+    latest = {}
+    documents = otto.iter_documents(result_pointer for result_pointer, _, _ in result_pointers)
+    try:
+        for (_, part_numbers, after), result in zip(result_pointers, documents):
+            if result is None or (after is not None and pd.to_datetime(result.date) <= pd.to_datetime(after)):
+                continue
+            for group in magnet_test_groups(result, part_numbers):
+                latest.setdefault(group, result)
+            if len(latest) == 3:
+                break
+    finally:
+        documents.close() # stop the document fetches that are still queued
+
+    return [latest[group] for group in ['radial', 'inner', 'outer'] if group in latest]
+
+
 # find the latest test for each type of scan
-def find_latest_magnet_tests(test_id_list):
-    radial_tests,axial_inner_tests,axial_outer_tests = find_magnet_test_groups(test_id_list)
+# with latest_only, documents are fetched newest first and the fetching stops once every type of scan is found
+# since and seen as in find_magnet_test_groups
+def find_latest_magnet_tests(test_id_list, since=None, latest_only=False, seen=None):
+    if latest_only:
+        final_tests = find_newest_magnet_tests(test_id_list, since, seen)
+        if final_tests is not None:
+            return final_tests
+
+    radial_tests,axial_inner_tests,axial_outer_tests = find_magnet_test_groups(test_id_list, since, seen)
     final_tests = []
 
     if len(radial_tests) > 0:
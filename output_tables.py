@@ -1,17 +1,27 @@
 # OUTPUT_TABLES.PY
 # functions that format all part tables and magnet tests
 
+import os
 import pandas as pd
 import numpy as np
 import networkx as nx
+import build_tree as bt
 import otto_tests as otto
+import pn_wo_map as pwm
 
 # output list of data information for each part in a graph
 def graph_to_info_output(G):
-    table = pd.DataFrame(columns=['PartNumber','SerialNumber','Description','WorkOrderID','TestSerialNumber'])
-    for n in G.nodes:
-        new = pd.Series({'PartNumber':G.nodes[n]['part_number'],'SerialNumber':G.nodes[n]['serial_number'],'Description':G.nodes[n]['desc'], 'WorkOrderID':G.nodes[n]['work_order'], 'TestSerialNumber':G.nodes[n]['test_sn']})
-        table = table._append(new, ignore_index=True)
+    columns = ['PartNumber','SerialNumber','Description','WorkOrderID','TestSerialNumber']
+    rows = [(data['part_number'], data['serial_number'], data['desc'], data['work_order'], data['test_sn']) for _, data in G.nodes(data=True)] # one pass over the nodes
+    table = pd.DataFrame(rows, columns=columns, dtype=object)
+    droppedtable = table.drop_duplicates()
+    return droppedtable
+
+
+# same as graph_to_info_output for a build_tree.CompactTree, read from its attribute columns without building the graph
+def tree_to_info_output(tree):
+    columns = {'part_number': 'PartNumber', 'serial_number': 'SerialNumber', 'desc': 'Description', 'work_order': 'WorkOrderID', 'test_sn': 'TestSerialNumber'}
+    table = tree.to_frame()[list(columns)].rename(columns=columns).reset_index(drop=True)
     droppedtable = table.drop_duplicates()
     return droppedtable
 
@@ -23,32 +33,107 @@ def remove_non_magnets(df):
 
 # if a part has more than 1 status and at least 1 of them is 'Removed', only retain the 'Removed' status in the tree
 def create_one_status(df):
-    grouped = df.groupby(['ChildTraceID', 'ParentTraceID']) # Group by 'ChildTraceId' and 'ParentTraceId'
-    # Filter rows
-    filtered_rows = grouped.apply(lambda x: x[x['Status'] == 'Removed'] if any(x['Status'] == 'Removed') else x)
-    # Reset index to clean up resulting DataFrame
-    filtered_df = filtered_rows.droplevel(0).reset_index(drop=True)
+    df = df.dropna(subset=['ChildTraceID', 'ParentTraceID']) # rows without both keys belong to no group
+    removed = df['Status'] == 'Removed'
+    pair_removed = removed.groupby([df['ChildTraceID'], df['ParentTraceID']]).transform('any') # True for every row of a pair that has a 'Removed' row
+    filtered_df = df[removed | ~pair_removed]
+    # order rows by pair like the groupby did, keeping the table order within a pair
+    filtered_df = filtered_df.sort_values(['ChildTraceID', 'ParentTraceID'], kind='stable').reset_index(drop=True)
     return filtered_df
 
 
-# outputs all magnet test data for a given list of magnets
-def full_table_to_tests(df,sat):
-    pn_wo_map = pd.read_pickle('pn_wo_map.pkl')
-    df = df[df['Description'].str.contains('PERMANENT MAGNET')] # work with only magnet parts
+# same as create_one_status for a table that arrives as a stream of chunks
+# each chunk is filtered against the pairs known to have a 'Removed' row when it arrives and reduced to the given columns
+# (all if None) with its repeated strings shared, so rows that cannot be kept and columns that are not used are never held;
+# memory still grows with the rows kept, which are all returned
+def create_one_status_chunks(chunks, columns=None):
+    keys = ['ChildTraceID', 'ParentTraceID']
+    kept = []
+    removed_pairs = set()
+    strings = {}
 
-    test_sns_str = set(df['TestSerialNumber']) # all test serial numbers of the magnets
-    snpndict={}
+    for chunk in chunks:
+        chunk = chunk.dropna(subset=keys)
+        removed = (chunk['Status'] == 'Removed').to_numpy()
+        pairs = list(zip(chunk['ChildTraceID'], chunk['ParentTraceID']))
+        removed_pairs.update(pair for pair, is_removed in zip(pairs, removed) if is_removed)
+        kept.append(bt.compact_chunk(chunk[removed | ~np.fromiter((pair in removed_pairs for pair in pairs), dtype=bool, count=len(pairs))], columns, strings))
 
-    for item in test_sns_str:
-        temp = df[df['TestSerialNumber'] == item]
-        wo_list = set(temp['WorkOrderID'])
-        map = pn_wo_map[pn_wo_map['WorkOrderID'].isin(wo_list)]
-        snpndict[int(item)] = set(map['PartNumber']) # all part numbers associated with the tests of a test serial number
+    if len(kept) == 0: # empty result without a single chunk
+        return pd.DataFrame(columns=columns if columns is not None else [*keys, 'Status'])
+
+    # rows kept before their pair's 'Removed' row arrived in a later chunk are dropped once at the end
+    filtered_df = pd.concat(kept, ignore_index=True)
+    kept.clear()
+    removed = (filtered_df['Status'] == 'Removed').to_numpy()
+    pairs = zip(filtered_df['ChildTraceID'], filtered_df['ParentTraceID'])
+    filtered_df = filtered_df[removed | ~np.fromiter((pair in removed_pairs for pair in pairs), dtype=bool, count=len(filtered_df))]
+    filtered_df = filtered_df.sort_values(keys, kind='stable').reset_index(drop=True)
+    return filtered_df
+
+
+# outputs all magnet test data rows for a given list of magnets, only for tests completed after since if given
+# (a date, or a {test serial number: date} watermark); seen gets the newest completion date of each test serial number queried
+# with latest_only only the newest test of each magnet type is fetched
+def full_table_to_test_entries(df,sat,since=None,latest_only=False,seen=None):
+    df = df[df['Description'].str.contains('PERMANENT MAGNET')] # work with only magnet parts
+    snpndict = pwm.get_mapping().test_sn_part_numbers(df) # all part numbers associated with the tests of each test serial number
 
     test_dicts = []
-    tests = otto.find_latest_magnet_tests(snpndict) # find all magnet tests
+    tests = otto.find_latest_magnet_tests(snpndict, since, latest_only, seen) # find all magnet tests
     for test in tests:
         test_dicts.append(otto.generate_magnet_test_entry(test,sat)) # format each test into csv row
 
+    return test_dicts
+
+
+# add magnet test rows to the output file
+def write_test_rows(test_dicts, path='output.csv'):
+    if len(test_dicts) == 0:
+        return
     test_table = pd.DataFrame(test_dicts)
-    test_table.to_csv('output.csv',mode='a',index=False,header=False) # add to output.csv
+    test_table.to_csv(path,mode='a',index=False,header=False) # add to output.csv
+
+
+# replace the rows of the output file that have the same sxid and test_id, or the same sxid and magnet_type, as a new row, add the rest
+# the file holds the newest test of each magnet type of a satellite (see otto.find_latest_magnet_tests), one row per sxid and magnet_type
+def upsert_test_rows(test_dicts, path='output.csv'):
+    if len(test_dicts) == 0:
+        return
+    new_table = pd.DataFrame(test_dicts)
+    if not os.path.exists(path): # first pull, the file is written with the columns of the new rows
+        new_table.to_csv(path,index=False)
+        return
+    old_table = pd.read_csv(path)
+
+    replaced = np.zeros(len(old_table), dtype=bool)
+    for column in ['test_id', 'magnet_type']:
+        new_keys = set(zip(new_table['sxid'].astype(str), new_table[column]))
+        old_keys = zip(old_table['sxid'].astype(str), old_table[column])
+        replaced |= np.fromiter((key in new_keys for key in old_keys), dtype=bool, count=len(old_table))
+    kept = old_table[~replaced]
+
+    test_table = pd.concat([kept, new_table], ignore_index=True).reindex(columns=old_table.columns)
+    test_table.to_csv(path,index=False)
+
+
+# rewrite the rows of the given satellites in the output file with the new rows, keeping the rows of every other satellite
+def replace_satellite_rows(test_dicts, sxids, path='output.csv'):
+    sxids = {str(sxid) for sxid in sxids}
+    new_table = pd.DataFrame(test_dicts)
+    if os.path.exists(path):
+        old_table = pd.read_csv(path)
+        kept = old_table[~old_table['sxid'].astype(str).isin(sxids)]
+        columns = old_table.columns
+    elif len(new_table) == 0:
+        return
+    else:
+        kept, columns = None, new_table.columns
+
+    test_table = pd.concat([kept, new_table], ignore_index=True).reindex(columns=columns)
+    test_table.to_csv(path,index=False)
+
+
+# outputs all magnet test data for a given list of magnets to output.csv
+def full_table_to_tests(df,sat):
+    write_test_rows(full_table_to_test_entries(df,sat))
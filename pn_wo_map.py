@@ -0,0 +1,77 @@
+# PN_WO_MAP.PY
+# PartNumber lookup by WorkOrderID, loaded once per process and extended with only the work orders added since the last sync
+
+import os
+import threading
+
+import pandas as pd
+
+DEFAULT_MAP_PATH = 'pn_wo_map.pkl'
+
+
+# mapping of WorkOrderID to PartNumber backed by the pickle written by SQL_queries.pn_to_wo_mapping
+class PnWoMap(object):
+    """PartNumber of every WorkOrderID, indexed by WorkOrderID"""
+
+    def __init__(self, path=DEFAULT_MAP_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            table = pd.read_pickle(path)
+        else:
+            table = pd.DataFrame({'PartNumber': pd.Series(dtype=object), 'WorkOrderID': pd.Series(dtype='int64')})
+        self.table = self._index(table)
+
+    @staticmethod
+    def _index(table):
+        """one row per WorkOrderID (the latest wins), indexed by WorkOrderID for lookups"""
+        table = table[['PartNumber', 'WorkOrderID']].drop_duplicates('WorkOrderID', keep='last')
+        return table.set_index('WorkOrderID', drop=False).sort_index()
+
+    def last_work_order(self):
+        """return the largest WorkOrderID in the mapping, 0 if it is empty"""
+        return int(self.table.index.max()) if len(self.table) else 0
+
+    def update(self, new_rows):
+        """add newly synced (PartNumber, WorkOrderID) rows and save the mapping file"""
+        with self._lock:
+            if len(new_rows) == 0:
+                return
+            self.table = self._index(pd.concat([self.table.reset_index(drop=True), new_rows], ignore_index=True))
+            self.table.reset_index(drop=True).to_pickle(self.path)
+
+    def part_number(self, wo_id):
+        """return the PartNumber of a WorkOrderID or None"""
+        try:
+            return self.table.at[wo_id, 'PartNumber']
+        except KeyError:
+            return None
+
+    def test_sn_part_numbers(self, df):
+        """
+        Return {test serial number: set of part numbers of its work orders}
+        Args:
+            df: part table with TestSerialNumber and WorkOrderID columns, one merge replaces a scan per test serial number
+        """
+        pairs = df[['TestSerialNumber', 'WorkOrderID']].drop_duplicates()
+        pairs = pairs.assign(WorkOrderID=pd.to_numeric(pairs['WorkOrderID'], errors='coerce'))
+        merged = pairs.merge(self.table.reset_index(drop=True), on='WorkOrderID', how='left')
+
+        snpndict = {int(sn): set() for sn in set(df['TestSerialNumber'])} # every test serial number, even without a known work order
+        for sn, pn in zip(merged['TestSerialNumber'], merged['PartNumber']):
+            if pd.notna(pn):
+                snpndict[int(sn)].add(pn)
+        return snpndict
+
+
+_mapping = None
+_mapping_lock = threading.Lock()
+
+
+# return the mapping shared by the whole process, loading the mapping file the first time
+def get_mapping(path=DEFAULT_MAP_PATH):
+    global _mapping
+    with _mapping_lock:
+        if _mapping is None or _mapping.path != path:
+            _mapping = PnWoMap(path)
+        return _mapping
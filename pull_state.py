@@ -0,0 +1,87 @@
+# PULL_STATE.PY
+# small sqlite store of the magnet tests already written to the output, used to pull only new tests
+
+import sqlite3
+import threading
+
+import pandas as pd
+
+DEFAULT_STATE_PATH = 'pull_state.db'
+
+
+# record of every (sxid, test_id, date) that has been emitted, and a watermark per test serial number of each satellite:
+# the completion date of the newest test of that serial number already looked at, so a later pull only queries the newer tests
+class PullState(object):
+    """sqlite backed state of an incremental pull, safe to share between pull threads"""
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._seen = {}
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        with self._con:
+            self._con.execute("""
+                CREATE TABLE IF NOT EXISTS emitted (
+                    sxid TEXT NOT NULL,
+                    test_id TEXT NOT NULL,
+                    magnet_type TEXT,
+                    date TEXT NOT NULL,
+                    test_sn TEXT,
+                    PRIMARY KEY (sxid, test_id)
+                )
+            """)
+            if 'test_sn' not in {row[1] for row in self._con.execute('PRAGMA table_info(emitted)')}: # state written before test_sn was kept
+                self._con.execute('ALTER TABLE emitted ADD COLUMN test_sn TEXT')
+            self._con.execute("""
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    sxid TEXT NOT NULL,
+                    test_sn TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    PRIMARY KEY (sxid, test_sn)
+                )
+            """)
+
+    def watermarks(self, sxid):
+        """return {test serial number: completion date of its newest test looked at} for a satellite"""
+        with self._lock:
+            return dict(self._con.execute('SELECT test_sn, date FROM watermarks WHERE sxid = ?', (str(sxid),)).fetchall())
+
+    def emitted(self, sxid):
+        """return a table of the tests already emitted for a satellite"""
+        with self._lock:
+            return pd.read_sql('SELECT * FROM emitted WHERE sxid = ?', self._con, params=(str(sxid),))
+
+    def newest_emitted(self, sxid, test_sns):
+        """return {magnet_type: completion date} of the newest test emitted for a satellite from one of the test serial numbers"""
+        emitted = self.emitted(sxid)
+        emitted = emitted[emitted['test_sn'].isin([str(sn) for sn in test_sns])]
+        return pd.to_datetime(emitted['date'], utc=True).groupby(emitted['magnet_type']).max().to_dict()
+
+    def see(self, sxid, seen):
+        """
+        keep the newest completion dates looked at for the test serial numbers of a satellite ({test_sn: date or None})
+        they are saved by the next record(), once the rows pulled with them are written
+        """
+        with self._lock:
+            self._seen.setdefault(str(sxid), {}).update({str(sn): date for sn, date in seen.items() if date})
+
+    def record(self, test_dicts):
+        """add the emitted test rows and the watermarks kept with see() to the state"""
+        with self._lock, self._con:
+            self._con.executemany(
+                'INSERT OR REPLACE INTO emitted (sxid, test_id, magnet_type, date, test_sn) VALUES (?, ?, ?, ?, ?)',
+                [(str(row['sxid']), row['test_id'], row.get('magnet_type'), row['date'], row.get('test_sn')) for row in test_dicts])
+            self._con.executemany(
+                'INSERT OR REPLACE INTO watermarks (sxid, test_sn, date) VALUES (?, ?, ?)',
+                [(sxid, sn, date) for sxid, seen in self._seen.items() for sn, date in seen.items()])
+            self._seen.clear()
+
+    def reset(self, sxids):
+        """forget the emitted tests and watermarks of the satellites, before their rows are written again by a full pull"""
+        sxids = [(str(sxid),) for sxid in sxids]
+        with self._lock, self._con:
+            self._con.executemany('DELETE FROM emitted WHERE sxid = ?', sxids)
+            self._con.executemany('DELETE FROM watermarks WHERE sxid = ?', sxids)
+
+    def close(self):
+        self._con.close()
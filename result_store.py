@@ -0,0 +1,89 @@
+# RESULT_STORE.PY
+# columnar store for magnet test rows: a parquet dataset partitioned by sxid and magnet_type
+
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+DEFAULT_STORE_PATH = 'magnet_store'
+
+# the 31 samples of a scan, stored together as one fixed width array column
+FLUX_COLUMNS = [f'flux density at rotation {float(deg)} degrees' for deg in range(0,361,12)]
+
+METRIC_COLUMNS = ['Average Magnetic Flux', 'Standard Deviation', 'Minimum Magnetic Flux Density', 'Maximum Magnetic Flux Density', 'Irregularity']
+
+SCHEMA = pa.schema(
+    [(name, pa.string()) for name in ['sxid', 'test_sn', 'pn', 'test_type']]
+    + [('date', pa.timestamp('us', tz='UTC'))]
+    + [(name, pa.string()) for name in ['test_id', 'otto_link', 'name', 'outcome', 'unit']]
+    + [('flux', pa.list_(pa.float64(), len(FLUX_COLUMNS)))]
+    + [(name, pa.float64()) for name in METRIC_COLUMNS]
+    + [(name, pa.string()) for name in ['magnet_view', 'magnet_type']]
+)
+
+PARTITIONING = ds.partitioning(pa.schema([('sxid', pa.string()), ('magnet_type', pa.string())]), flavor='hive')
+
+
+# convert magnet test rows (dicts from generate_magnet_test_entry or a table shaped like output.csv) to an arrow table
+def rows_to_table(rows):
+    df = pd.DataFrame(rows).reindex(columns=[name for name in SCHEMA.names if name != 'flux'] + FLUX_COLUMNS)
+
+    columns = {}
+    for field in SCHEMA:
+        if field.name == 'flux':
+            values = df[FLUX_COLUMNS].to_numpy(dtype=np.float64).ravel()
+            columns['flux'] = pa.FixedSizeListArray.from_arrays(pa.array(values, mask=np.isnan(values)), len(FLUX_COLUMNS))
+        elif field.name == 'date':
+            columns['date'] = pa.array(pd.to_datetime(df['date'], utc=True), type=field.type)
+        elif pa.types.is_string(field.type):
+            columns[field.name] = pa.array([None if pd.isna(v) else str(v) for v in df[field.name]], type=field.type)
+        else:
+            columns[field.name] = pa.array(df[field.name], type=field.type, from_pandas=True)
+
+    return pa.table(columns, schema=SCHEMA)
+
+
+# write magnet test rows to the store, replacing the existing rows of every sxid/magnet_type partition that is written
+# with replace_partitions False only the existing rows with the same test_id are replaced, the other rows of the partition are kept
+def write_results(rows, path=DEFAULT_STORE_PATH, replace_partitions=True):
+    if len(rows) == 0:
+        return
+    table = rows_to_table(rows)
+    if not replace_partitions and os.path.exists(path):
+        old = read_table(path, sxids=set(table['sxid'].to_pylist()))
+        partitions = set(zip(table['sxid'].to_pylist(), table['magnet_type'].to_pylist()))
+        test_ids = set(table['test_id'].to_pylist())
+        keep = [key in partitions and test_id not in test_ids
+                for key, test_id in zip(zip(old['sxid'].to_pylist(), old['magnet_type'].to_pylist()), old['test_id'].to_pylist())]
+        table = pa.concat_tables([old.filter(pa.array(keep, type=pa.bool_())).select(SCHEMA.names), table])
+    ds.write_dataset(table, path, format='parquet', partitioning=PARTITIONING,
+                     existing_data_behavior='delete_matching', basename_template='part-{i}.parquet')
+
+
+# open the store as an arrow dataset
+def open_store(path=DEFAULT_STORE_PATH):
+    return ds.dataset(path, format='parquet', partitioning=PARTITIONING, schema=SCHEMA)
+
+
+# read only the selected satellites, magnet types and columns from the store as an arrow table
+def read_table(path=DEFAULT_STORE_PATH, sxids=None, magnet_types=None, columns=None):
+    filter = None
+    if sxids is not None:
+        filter = ds.field('sxid').isin([str(sxid) for sxid in sxids])
+    if magnet_types is not None:
+        type_filter = ds.field('magnet_type').isin(list(magnet_types))
+        filter = type_filter if filter is None else filter & type_filter
+    return open_store(path).to_table(columns=columns, filter=filter)
+
+
+# read the selected rows as a dataframe; the flux column holds one array of 31 samples per row
+def read_results(path=DEFAULT_STORE_PATH, sxids=None, magnet_types=None, columns=None):
+    return read_table(path, sxids, magnet_types, columns).to_pandas()
+
+
+# return the flux samples of an arrow table as a (rows, 31) array without going through python objects
+def flux_matrix(table):
+    flux = table['flux'].combine_chunks()
+    return flux.flatten().to_numpy(zero_copy_only=False).reshape(len(flux), len(FLUX_COLUMNS))
@@ -0,0 +1,77 @@
+# SUM_CURVE.PY
+# predicted axial sum curves for the whole fleet at once: inner + outer axial scans aligned to the combined radial scan
+
+import numpy as np
+import pandas as pd
+
+
+# return the sxids and (n_sats, 31) inner, outer and combined scan matrices for every satellite with exactly one scan of each type
+def fleet_matrices(df):
+    deg_cols = [col for col in df.columns if 'degrees' in col]
+    df = df[df.groupby('sxid')['sxid'].transform('size') == 3] # same rule as find_closest_sum_curve: 3 scans per sat
+    kind = df['magnet_type'].where(df['magnet_type'].isin(['inner', 'outer']), 'combined')
+    df = df[kind.groupby(df['sxid']).transform('nunique') == 3].assign(kind=kind)
+
+    sats = pd.unique(df['sxid'])
+    matrices = [df[df['kind'] == k].set_index('sxid').loc[sats, deg_cols].to_numpy(dtype=float) for k in ['inner', 'outer', 'combined']]
+    return sats, *matrices
+
+
+# return the sxids of the satellites classified as mode shifters
+def load_mode_shifters(path='classified_CORRECT.csv'):
+    ms = pd.read_csv(path)
+    ms = ms[ms['mode_shifters'] == 'y']
+    return list(ms['sxid'])
+
+
+# roll every row of a matrix left by its own shift, the row-wise version of np.roll(row, -shift)
+def roll_rows(matrix, shifts):
+    n = matrix.shape[1]
+    return matrix[np.arange(len(matrix))[:, None], (np.arange(n) + shifts[:, None]) % n]
+
+
+# align the predicted sum curve of every satellite to its combined curve
+def align_sum_curves(inner, outer, combined):
+    """
+    Return the aligned sum curves, their sum of squared residuals and the shift used, one row per satellite
+    Args:
+        inner, outer, combined: (n_sats, n_points) scans of each satellite
+    The inner scan is rolled to start at its minimum and the outer scan at its maximum, as in find_closest_sum_curve.
+    Their sum is then circularly shifted to the position closest to the combined scan, for all satellites in one
+    FFT cross-correlation instead of trying every shift in a loop.
+    """
+    inner, outer, combined = (np.asarray(m, dtype=float) for m in (inner, outer, combined))
+    n = combined.shape[1]
+
+    sums = roll_rows(inner, inner.argmin(axis=1)) + roll_rows(outer, outer.argmax(axis=1))
+
+    # |roll(s, k) - c|^2 = |s|^2 + |c|^2 - 2 * xcorr[k] with xcorr[k] = sum_i s[i - k] * c[i]
+    xcorr = np.fft.irfft(np.fft.rfft(combined, axis=1) * np.conj(np.fft.rfft(sums, axis=1)), n=n, axis=1)
+    energy = (sums ** 2).sum(axis=1, keepdims=True) + (combined ** 2).sum(axis=1, keepdims=True)
+    all_residuals = energy - 2 * xcorr
+
+    # first shift within FFT rounding error of the minimum, so ties resolve to the smallest shift like the loop did
+    min_residuals = all_residuals.min(axis=1, keepdims=True)
+    tolerance = 1e-12 * energy
+    shifts = np.argmax(all_residuals <= min_residuals + tolerance, axis=1)
+
+    aligned = roll_rows(sums, -shifts) # np.roll(row, shift)
+    residuals = ((aligned - combined) ** 2).sum(axis=1)
+    return aligned, residuals, shifts
+
+
+# return the sxids of the result store (strings) as read_csv reads them from a test table, numbers if they all are,
+# so they match the sxids of load_mode_shifters
+def csv_sxids(sxids):
+    try:
+        return pd.to_numeric(sxids)
+    except (ValueError, TypeError):
+        return sxids
+
+
+# same as fleet_matrices, reading only the flux arrays of the selected satellites from the parquet result store
+def store_matrices(path=None, sxids=None):
+    import result_store as rs
+    table = rs.read_table(path or rs.DEFAULT_STORE_PATH, sxids, columns=['sxid', 'magnet_type', 'flux'])
+    df = pd.concat([table.drop_columns(['flux']).to_pandas(), pd.DataFrame(rs.flux_matrix(table), columns=rs.FLUX_COLUMNS)], axis=1)
+    return fleet_matrices(df.assign(sxid=csv_sxids(df['sxid'])))
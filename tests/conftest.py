@@ -0,0 +1,83 @@
+# the modules live at the repository root, next to this folder
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from genealogy_mirror import GenealogyMirror, MIRROR_TABLES
+
+
+# sqlite stand-in for the ERP genealogy tables, with the mirror's schema and table names (MIRROR_TABLES)
+# each satellite has two thruster assemblies, each with magnets and subassemblies two levels deep; the issued quantity
+# of a part's operation requirement makes it Issued or Removed, and its work order lot gives its test serial number
+class StandInErp(object):
+    """sqlite database shaped like the ERP tables the genealogy queries read"""
+
+    PARTS = [(1, 'SL02-0001', 'STARLINK SATELLITE'), (2, 'SL02-TA', 'THRUSTER ASSEMBLY'), (3, 'MAG-1', 'PERMANENT MAGNET, INNER'),
+             (4, 'MAG-2', 'PERMANENT MAGNET, OUTER'), (5, 'SUB-1', 'SUBASSEMBLY')]
+
+    def __init__(self, path, seed=0):
+        self.tables = MIRROR_TABLES
+        self.path = path
+        self._schema = GenealogyMirror(path)
+        self._rng = random.Random(seed)
+        self._ids = {'trace': 0, 'requirement': 0, 'work_order': 0, 'operation': 0}
+        self.con = self._schema.connect()
+        with self.con:
+            self.con.executemany('INSERT INTO Part (PartID, PartNumber, Description) VALUES (?, ?, ?)', self.PARTS)
+        self.engine = self._schema.engine()
+
+    def _next(self, kind):
+        self._ids[kind] += 1
+        return self._ids[kind]
+
+    def _trace(self, part_id, sn, lot=None):
+        trace_id = self._next('trace')
+        self.con.execute('INSERT INTO Trace (TraceID, PartID, SerialNumber, LotCode) VALUES (?, ?, ?, ?)', (trace_id, part_id, sn, lot))
+        return trace_id
+
+    def _link(self, parent, child, part_id, removed=False):
+        work_order = self._next('work_order')
+        base = f'B{work_order}'
+        self.con.execute('INSERT INTO WorkOrder (WorkOrderID, BaseID, PartID) VALUES (?, ?, ?)', (work_order, base, part_id))
+        operation = self._next('operation')
+        self.con.execute('INSERT INTO Operation (OperationID, WorkOrderID, SequenceNumber) VALUES (?, ?, ?)', (operation, work_order, 10))
+        requirement = self._next('requirement')
+        self.con.execute('INSERT INTO Requirement (RequirementID, PartID, WorkOrderID, OperationID, IssuedQuantity) VALUES (?, ?, ?, ?, ?)',
+                         (requirement, part_id, work_order, None, 1))
+        self.con.execute('INSERT INTO Requirement (RequirementID, PartID, WorkOrderID, OperationID, IssuedQuantity) VALUES (?, ?, ?, ?, ?)',
+                         (self._next('requirement'), part_id, None, operation, -1 if removed else 1))
+        self._trace(part_id, str(self._rng.randint(100000, 999999)), f'WO{base}') # traveler holding the test serial number
+        self.con.execute('INSERT INTO GenealogyTraceDetail (ChildTraceID, ParentTraceID, RequirementID) VALUES (?, ?, ?)', (child, parent, requirement))
+
+    def add_satellites(self, sxids, per=3, removed_ratio=0.2):
+        """add the genealogy of satellites to the tables"""
+        with self.con:
+            for sxid in sxids:
+                sat = self._trace(1, str(sxid))
+                for a in range(2):
+                    thruster = self._trace(2, f'TA{sxid}-{a}')
+                    self._link(sat, thruster, 2)
+                    for m in range(per):
+                        part_id = self._rng.choice([3, 4, 5])
+                        child = self._trace(part_id, f'M{sxid}-{a}-{m}')
+                        self._link(thruster, child, part_id, self._rng.random() < removed_ratio)
+                        for k in range(per):
+                            part_id = self._rng.choice([3, 4, 5])
+                            grandchild = self._trace(part_id, f'N{sxid}-{a}-{m}-{k}')
+                            self._link(child, grandchild, part_id, self._rng.random() < removed_ratio)
+
+    def close(self):
+        self.con.close()
+        self.engine.dispose()
+
+
+@pytest.fixture
+def erp(tmp_path):
+    standin = StandInErp(str(tmp_path / 'erp.db'))
+    standin.add_satellites(['11072', '11075', '11080'])
+    yield standin
+    standin.close()
@@ -0,0 +1,101 @@
+import os
+import json
+import zlib
+
+import instrumentation as instr
+import otto_tests
+from document_cache import DocumentCache
+from fake_otto_server import FakeOttoServer, magnet_document
+
+
+def pointers(server, sns):
+    return [{'case_id': case_id} for sn in sns for case_id, _ in server.documents(sn)]
+
+
+def document(case_id, completed='2023-01-01T08:00:00'):
+    return magnet_document(case_id, '100001', 'inner', completed)
+
+
+# size of the file put writes for a document
+def stored_size(case_id):
+    return len(zlib.compress(json.dumps(document(case_id), separators=(',', ':')).encode()))
+
+
+def cached_ids(cache):
+    return sorted(name[:-len('.json.z')] for name in os.listdir(cache.directory))
+
+
+def test_second_pass_is_served_from_the_cache(tmp_path):
+    with FakeOttoServer(tests_per_sn=5) as server:
+        result_pointers = pointers(server, ['100001', '100002'])
+        cache = DocumentCache(tmp_path / 'cache')
+        otto = otto_tests.OttoQuery(server.host, otto_tests.DEFAULT_API_PATH, max_workers=3, cache=cache)
+
+        with instr.RunReport() as report:
+            with instr.stage('otto'):
+                first = otto.grab_documents(result_pointers)
+            with instr.stage('otto'):
+                second = otto.grab_documents(result_pointers)
+        assert server.stats()['document_requests'] == len(result_pointers) # the second pass made no request
+        assert [result.case_id for result in second] == [result.case_id for result in first]
+        assert [result.steps for result in second] == [result.steps for result in first]
+
+        first_counts, second_counts = report.to_frame()[['cache_hits', 'cache_misses', 'http_requests']].to_dict(orient='records')
+        assert first_counts == {'cache_hits': 0, 'cache_misses': len(result_pointers), 'http_requests': len(result_pointers)}
+        assert second_counts == {'cache_hits': len(result_pointers), 'cache_misses': 0, 'http_requests': 0}
+        assert cache.stats()['hits'] == cache.stats()['misses'] == cache.stats()['entries'] == len(result_pointers)
+
+
+def test_incomplete_documents_are_not_cached(tmp_path):
+    with FakeOttoServer(tests_per_sn=4) as server:
+        result_pointers = pointers(server, ['100001'])
+        running = server.documents('100001')[1][1]
+        running['completed'] = '' # still running, its document can change
+        otto = otto_tests.OttoQuery(server.host, otto_tests.DEFAULT_API_PATH, cache=DocumentCache(tmp_path / 'cache'))
+
+        otto.grab_documents(result_pointers)
+        otto.grab_documents(result_pointers)
+        assert server.stats()['document_requests'] == len(result_pointers) + 1
+        assert running['uuid'] not in cached_ids(otto.cache)
+
+
+def test_size_cap_evicts_the_least_recently_used(tmp_path):
+    size = max(stored_size(case_id) for case_id in 'abcd')
+    cache = DocumentCache(tmp_path / 'cache', max_bytes=3 * size)
+    for case_id in 'abc':
+        cache.put(case_id, document(case_id))
+    assert cache.get('a') is not None # a is now more recently used than b and c
+
+    cache.put('d', document('d'))
+    assert cached_ids(cache) == ['a', 'c', 'd']
+    assert cache.get('b') is None
+    assert cache.stats()['bytes'] <= cache.max_bytes and cache.stats()['entries'] == 3
+
+
+def test_lru_order_is_kept_across_runs_by_file_times(tmp_path):
+    size = max(stored_size(case_id) for case_id in 'abcd')
+    cache = DocumentCache(tmp_path / 'cache', max_bytes=3 * size)
+    for case_id, mtime in zip('abc', [300, 100, 200]):
+        cache.put(case_id, document(case_id))
+        os.utime(cache._path(case_id), (mtime, mtime))
+
+    # a new run orders the files by their time: b, c, a; reading b makes c the least recently used
+    cache = DocumentCache(tmp_path / 'cache', max_bytes=3 * size)
+    assert cache.get('b') == document('b')
+    cache.put('d', document('d'))
+    assert cached_ids(cache) == ['a', 'b', 'd']
+
+
+def test_bypass_neither_reads_nor_writes(tmp_path):
+    DocumentCache(tmp_path / 'cache').put('a', document('a'))
+    cache = DocumentCache(tmp_path / 'cache', bypass=True)
+    assert cache.get('a') is None
+    cache.put('b', document('b'))
+    assert cached_ids(cache) == ['a']
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_put_skips_documents_without_a_completion_date(tmp_path):
+    cache = DocumentCache(tmp_path / 'cache')
+    cache.put('a', document('a', completed=None))
+    assert cache.get('a') is None and cache.stats()['entries'] == 0
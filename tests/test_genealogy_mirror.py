@@ -0,0 +1,87 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import SQL_queries as sq
+import genealogy_mirror as gm
+
+
+def table_counts(path):
+    con = sqlite3.connect(path)
+    try:
+        return {table: con.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in gm.MIRROR_COLUMNS}
+    finally:
+        con.close()
+
+
+def sorted_table(df):
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def assert_same_trees(mirror, erp, sats):
+    expected = sorted_table(sq.get_full_magnets_trees(erp.engine, sats, tables=erp.tables))
+    pd.testing.assert_frame_equal(sorted_table(mirror.magnets_trees(sats)), expected, check_dtype=False)
+    streamed = pd.concat(list(mirror.magnets_trees(sats, chunksize=5)), ignore_index=True)
+    pd.testing.assert_frame_equal(sorted_table(streamed), expected, check_dtype=False)
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    return gm.GenealogyMirror(str(tmp_path / 'mirror.db'))
+
+
+def test_sync_copies_every_row_and_trees_match_the_erp_query(erp, mirror):
+    copied = mirror.sync(erp.engine, tables=erp.tables, chunksize=10)
+    assert copied == table_counts(erp.path)
+    assert table_counts(mirror.path) == table_counts(erp.path)
+    assert_same_trees(mirror, erp, ['11072', '11075', '11080'])
+
+
+def test_sync_copies_only_new_rows_from_the_watermark(erp, mirror):
+    mirror.sync(erp.engine, tables=erp.tables)
+    before = table_counts(erp.path)
+    assert mirror.sync(erp.engine, tables=erp.tables) == dict.fromkeys(gm.MIRROR_COLUMNS, 0)
+
+    erp.add_satellites(['11090'])
+    after = table_counts(erp.path)
+    copied = mirror.sync(erp.engine, tables=erp.tables, chunksize=10)
+    assert copied == {table: after[table] - before[table] for table in gm.MIRROR_COLUMNS}
+    assert mirror.last_key('Trace') == erp.con.execute('SELECT MAX(TraceID) FROM Trace').fetchone()[0]
+    assert_same_trees(mirror, erp, ['11072', '11090'])
+
+
+def test_interrupted_sync_resumes_after_the_last_committed_chunk(erp, mirror, monkeypatch):
+    read_chunks = sq.run_warp_query_chunks
+
+    def interrupted(*args, **kwargs):
+        chunks = read_chunks(*args, **kwargs)
+        yield next(chunks)
+        raise ConnectionError('connection lost')
+
+    monkeypatch.setattr(sq, 'run_warp_query_chunks', interrupted)
+    with pytest.raises(ConnectionError):
+        mirror.sync(erp.engine, tables=erp.tables, chunksize=10)
+    first_table = next(iter(gm.MIRROR_COLUMNS))
+    assert table_counts(mirror.path)[first_table] == 10
+    monkeypatch.undo()
+
+    copied = mirror.sync(erp.engine, tables=erp.tables, chunksize=10)
+    assert copied[first_table] == table_counts(erp.path)[first_table] - 10
+    assert table_counts(mirror.path) == table_counts(erp.path)
+    assert_same_trees(mirror, erp, ['11072', '11075', '11080'])
+
+
+def test_full_sync_picks_up_rows_edited_in_place(erp, mirror):
+    mirror.sync(erp.engine, tables=erp.tables)
+    with erp.con:
+        erp.con.execute("UPDATE Part SET Description = 'PERMANENT MAGNET, SPARE' WHERE PartID = 5")
+
+    mirror.sync(erp.engine, tables=erp.tables)
+    assert 'PERMANENT MAGNET, SPARE' not in set(mirror.magnets_trees(['11072'])['ChildDesc'])
+
+    copied = mirror.sync(erp.engine, tables=erp.tables, full=True)
+    assert copied == table_counts(erp.path)
+    assert table_counts(mirror.path) == table_counts(erp.path)
+    assert 'PERMANENT MAGNET, SPARE' in set(mirror.magnets_trees(['11072'])['ChildDesc'])
+    assert_same_trees(mirror, erp, ['11072', '11075', '11080'])
@@ -0,0 +1,160 @@
+import json
+import random
+
+import pytest
+
+import otto_tests
+from fake_otto_server import FakeOttoServer, MAGNET_PN, magnet_document
+
+
+def pointers(server, sns):
+    return [{'case_id': case_id} for sn in sns for case_id, _ in server.documents(sn)]
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_grab_documents_keeps_pointer_order(max_workers):
+    with FakeOttoServer(tests_per_sn=6, jitter=0.02) as server:
+        result_pointers = pointers(server, ['100001', '100002', '100003'])
+        random.Random(0).shuffle(result_pointers)
+        otto = otto_tests.OttoQuery(server.host, otto_tests.DEFAULT_API_PATH, max_workers=max_workers)
+
+        results = otto.grab_documents(result_pointers)
+        assert [result.case_id for result in results] == [p['case_id'] for p in result_pointers]
+        streamed = list(otto.iter_documents(iter(result_pointers)))
+        assert [result.case_id for result in streamed] == [p['case_id'] for p in result_pointers]
+
+
+def test_grab_documents_drops_malformed_pointers():
+    with FakeOttoServer(tests_per_sn=3) as server:
+        result_pointers = pointers(server, ['100001'])
+        otto = otto_tests.OttoQuery(server.host, otto_tests.DEFAULT_API_PATH, max_workers=2)
+        results = otto.grab_documents([result_pointers[0], {'name': 'no case id'}, result_pointers[2]])
+        assert [result.case_id for result in results] == [result_pointers[0]['case_id'], result_pointers[2]['case_id']]
+
+
+@pytest.mark.parametrize('error_statuses', [(429,), (500, 503), (502, 504)])
+def test_session_retries_rate_limits_and_server_errors(error_statuses):
+    with FakeOttoServer(tests_per_sn=3, error_statuses=error_statuses) as server:
+        result_pointers = pointers(server, ['100001'])
+        otto = otto_tests.OttoQuery(server.host, otto_tests.DEFAULT_API_PATH, max_workers=3)
+
+        results = otto.grab_documents(result_pointers)
+        assert [result.case_id for result in results] == [p['case_id'] for p in result_pointers]
+        stats = server.stats()
+        assert stats['errors'] == len(error_statuses) * len(result_pointers)
+        assert stats['requests'] == (len(error_statuses) + 1) * len(result_pointers)
+
+
+def test_session_gives_up_after_its_retries():
+    with FakeOttoServer(tests_per_sn=1, error_statuses=(503,) * 3) as server:
+        session = otto_tests.make_session(pool_size=1, retries=1)
+        assert session.get(f'{server.host}{otto_tests.DEFAULT_API_PATH}documents/100001-0000').status_code == 503
+        assert server.stats()['requests'] == 2
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_document_fetches_are_bounded_by_max_workers(max_workers):
+    with FakeOttoServer(tests_per_sn=8, latency=0.03) as server:
+        result_pointers = pointers(server, ['100001', '100002'])
+        otto = otto_tests.OttoQuery(server.host, otto_tests.DEFAULT_API_PATH, max_workers=max_workers)
+
+        assert len(otto.grab_documents(result_pointers)) == len(result_pointers)
+        assert len(list(otto.iter_documents(iter(result_pointers)))) == len(result_pointers)
+        assert server.stats()['max_in_flight'] == max_workers
+
+
+# otto query whose references pages come from a function of the page number instead of a server
+def paged_query(page_items, total_items, max_workers=1):
+    otto = otto_tests.OttoQuery('http://unused', otto_tests.DEFAULT_API_PATH, max_workers=max_workers)
+    requested = []
+
+    def query(query_string):
+        page = int(query_string.split('&page=')[1].split('&')[0])
+        requested.append(page)
+        return {'total_items': total_items, 'items': page_items(page)}
+
+    otto._query = query
+    return otto, requested
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_iter_pointers_pages_through_every_pointer(max_workers):
+    with FakeOttoServer(tests_per_sn=25) as server:
+        otto = otto_tests.OttoQuery(server.host, otto_tests.DEFAULT_API_PATH, max_workers=max_workers)
+        found = [p['case_id'] for p in otto.iter_pointers(otto.reference_query('100001', '100002'), page_size=7)]
+        assert found == [case_id for sn in ['100001', '100002'] for case_id, _ in server.documents(sn)]
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_iter_pointers_stops_when_the_api_ignores_paging(max_workers):
+    items = [{'case_id': f'c{i}'} for i in range(5)]
+    otto, requested = paged_query(lambda page: items, total_items=50, max_workers=max_workers)
+    assert [p['case_id'] for p in otto.iter_pointers('references?', page_size=5)] == [f'c{i}' for i in range(5)]
+    assert 2 in requested and len(requested) < 10
+
+
+def test_iter_pointers_skips_pointers_shifted_by_new_results():
+    # a result added while paging pushes the last pointer of page 1 onto page 2
+    pages = {1: ['c0', 'c1', 'c2'], 2: ['c2', 'c3', 'c4'], 3: ['c5']}
+    otto, _ = paged_query(lambda page: [{'case_id': case_id} for case_id in pages.get(page, [])], total_items=7)
+    assert [p['case_id'] for p in otto.iter_pointers('references?', page_size=3)] == ['c0', 'c1', 'c2', 'c3', 'c4', 'c5']
+
+
+@pytest.mark.parametrize('latest_only', [False, True])
+def test_find_latest_magnet_tests_queries_only_tests_after_each_serial_watermark(monkeypatch, latest_only):
+    with FakeOttoServer(tests_per_sn=12) as server:
+        monkeypatch.setattr(otto_tests, 'otto', otto_tests.OttoQuery(server.host, otto_tests.DEFAULT_API_PATH, max_workers=1))
+        part_numbers = ['SL02-MAG1']
+
+        seen = {}
+        first = otto_tests.find_latest_magnet_tests({'100001': part_numbers}, latest_only=latest_only, seen=seen)
+        assert len(first) > 0
+        assert seen == {'100001': max(doc['completed'] for _, doc in server.documents('100001'))}
+
+        # nothing completed after the watermark: no document is fetched
+        fetched = server.stats()['document_requests']
+        assert otto_tests.find_latest_magnet_tests({'100001': part_numbers}, since=seen, latest_only=latest_only) == []
+        assert server.stats()['document_requests'] == fetched
+
+        # a replacement magnet has no watermark yet, all its tests are looked at
+        both = otto_tests.find_latest_magnet_tests({'100001': part_numbers, '100002': part_numbers}, since=seen, latest_only=latest_only)
+        replacement = otto_tests.find_latest_magnet_tests({'100002': part_numbers}, latest_only=latest_only)
+        assert [test.case_id for test in both] == [test.case_id for test in replacement]
+
+
+@pytest.mark.parametrize('pointer_fields', [True, False])
+@pytest.mark.parametrize('part_number', ['SL02-MAG1', 'SL03-OTHER'])
+def test_pointer_filter_fetches_only_passing_magnet_tests_of_the_part_numbers(monkeypatch, pointer_fields, part_number):
+    with FakeOttoServer(tests_per_sn=30, failure_ratio=0.3, pointer_fields=pointer_fields) as server:
+        monkeypatch.setattr(otto_tests, 'otto', otto_tests.OttoQuery(server.host, otto_tests.DEFAULT_API_PATH, max_workers=1))
+        groups = otto_tests.find_magnet_test_groups({'100001': [part_number]})
+
+        docs = [doc for _, doc in server.documents('100001')]
+        matching = [doc for doc in docs if 'magnet' in doc['name'] and doc['outcome'] == 'pass' and part_number in doc['references'][1]['ref_id']]
+        assert 0 < len([doc for doc in docs if 'magnet' in doc['name'] and doc['outcome'] == 'pass']) < len(docs)
+        # pointers without the fields are not filtered, their documents are checked as before
+        assert server.stats()['document_requests'] == (len(matching) if pointer_fields else len(docs))
+        assert sorted(test.case_id for group in groups for test in group) == sorted(doc['uuid'] for doc in matching)
+
+
+def test_pointer_filter_keeps_pointers_without_the_fields():
+    keep = otto_tests.magnet_pointer_filter(['SL02-MAG1'])
+    assert keep({'case_id': 'c0'}) and keep({'case_id': 'c1', 'completed': '2023-01-01T00:00:00'})
+    assert keep({'case_id': 'c2', 'name': 'magnet Radial flux scan'})
+    assert not keep({'case_id': 'c3', 'outcome': 'fail'})
+    assert not keep({'case_id': 'c4', 'name': 'leak test'})
+    assert not keep({'case_id': 'c5', 'part_number': 'SL03-OTHER'})
+
+
+def test_result_lookups_and_sections_match_the_decoded_document():
+    document = magnet_document('100001-0000', '100001', 'inner', '2023-01-01T08:00:00')
+    document['references'] += [{'ref_type': 'warp_workorder', 'ref_id': 'WO1'}, {'ref_type': 'serial_number', 'ref_id': 'not the first'}]
+    raw = json.dumps(document).encode()
+
+    for result in [otto_tests.Result('100001-0000', document), otto_tests.Result.from_raw('100001-0000', raw)]:
+        assert (result.sn, result.pn, result.workorder, result.otto_link) == ('100001', MAGNET_PN, 'WO1', '/report/100001-0000')
+        assert result._raw is not None and result._decoded is None # nothing decoded before a section is read
+        for section in otto_tests.Result._SECTIONS:
+            assert getattr(result, section) == document[section]
+        assert result._raw is None # the decoded sections replace the json bytes
+        assert result.steps is result.steps
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import output_tables as ot
+
+
+# create_one_status as it was before vectorizing, with a python callback per (ChildTraceID, ParentTraceID) group
+def create_one_status_apply(df):
+    grouped = df.groupby(['ChildTraceID', 'ParentTraceID'])
+    filtered_rows = grouped.apply(lambda x: x[x['Status'] == 'Removed'] if any(x['Status'] == 'Removed') else x)
+    return filtered_rows.droplevel(0).reset_index(drop=True)
+
+
+def status_table(rows):
+    return pd.DataFrame(rows, columns=['ChildTraceID', 'ParentTraceID', 'ChildPN', 'Status'])
+
+
+@pytest.mark.filterwarnings('ignore::DeprecationWarning', 'ignore::FutureWarning')
+@pytest.mark.parametrize('seed', range(5))
+def test_create_one_status_matches_groupby_apply(seed):
+    rng = np.random.default_rng(seed)
+    n = 2000
+    pair = rng.integers(0, 300, n)
+    df = status_table({'ChildTraceID': pair * 7 + 1, 'ParentTraceID': (pair // 4).astype(float), 'ChildPN': [f'PN{i}' for i in range(n)],
+                       'Status': rng.choice(['Issued', 'Removed', 'Unknown'], n, p=[0.7, 0.2, 0.1])})
+    df.loc[rng.choice(n, 50, replace=False), 'ParentTraceID'] = np.nan # rows without a parent key belong to no group
+
+    pd.testing.assert_frame_equal(ot.create_one_status(df), create_one_status_apply(df))
+
+
+def test_create_one_status_keeps_only_removed_rows_of_mixed_pairs():
+    df = status_table([
+        (2, 1, 'a', 'Issued'),
+        (2, 1, 'b', 'Removed'),
+        (2, 1, 'c', 'Removed'),
+        (3, 1, 'd', 'Issued'),
+        (3, 1, 'e', 'Unknown'),
+        (np.nan, 1, 'f', 'Removed'),
+        (4, np.nan, 'g', 'Issued'),
+    ])
+    out = ot.create_one_status(df)
+    assert out['ChildPN'].tolist() == ['b', 'c', 'd', 'e']
+    assert out.index.tolist() == [0, 1, 2, 3]
+
+
+def test_create_one_status_orders_rows_by_pair_keeping_table_order_within_a_pair():
+    df = status_table([
+        (5, 1, 'a', 'Issued'),
+        (2, 9, 'b', 'Issued'),
+        (2, 1, 'c', 'Unknown'),
+        (5, 1, 'd', 'Issued'),
+        (2, 1, 'e', 'Issued'),
+    ])
+    assert ot.create_one_status(df)['ChildPN'].tolist() == ['c', 'e', 'b', 'a', 'd']
+
+
+def test_create_one_status_chunks_matches_create_one_status():
+    rng = np.random.default_rng(0)
+    n = 3000
+    pair = rng.integers(0, 500, n)
+    df = status_table({'ChildTraceID': pair * 7 + 1, 'ParentTraceID': pair // 4, 'ChildPN': [f'PN{i}' for i in range(n)],
+                       'Status': rng.choice(['Issued', 'Removed'], n, p=[0.8, 0.2])})
+    chunks = (df.iloc[i:i + 400] for i in range(0, n, 400))
+    pd.testing.assert_frame_equal(ot.create_one_status_chunks(chunks), ot.create_one_status(df))
+
+
+def magnet_row(sxid, test_id, magnet_type, date):
+    return {'sxid': sxid, 'test_id': test_id, 'magnet_type': magnet_type, 'date': date, 'Average Magnetic Flux': 900.0}
+
+
+def test_upsert_test_rows_keeps_one_row_per_magnet_type(tmp_path):
+    path = tmp_path / 'output.csv'
+    ot.upsert_test_rows([magnet_row(1, 'a', 'combined', '2023-01-01'), magnet_row(1, 'b', 'inner', '2023-01-01'),
+                         magnet_row(2, 'c', 'combined', '2023-01-01')], path)
+    ot.upsert_test_rows([magnet_row(1, 'd', 'combined', '2023-02-01')], path) # newer radial test of satellite 1
+    ot.upsert_test_rows([magnet_row(2, 'c', 'combined', '2023-01-01')], path) # same test pulled again
+
+    table = pd.read_csv(path)
+    assert sorted(zip(table['sxid'], table['magnet_type'], table['test_id'])) == [(1, 'combined', 'd'), (1, 'inner', 'b'), (2, 'combined', 'c')]
@@ -0,0 +1,58 @@
+import pandas as pd
+
+import magnet_test_pull as mtp
+from pull_state import PullState
+
+
+def magnet_row(test_id, test_sn, magnet_type, date, sxid='11072'):
+    return {'sxid': sxid, 'test_id': test_id, 'test_sn': test_sn, 'magnet_type': magnet_type, 'date': date}
+
+
+def test_watermarks_are_saved_with_the_rows(tmp_path):
+    state = PullState(tmp_path / 'state.db')
+    state.see('11072', {'A': '2023-01-02T00:00:00', 'B': None})
+    assert state.watermarks('11072') == {} # not saved until the rows are recorded
+    state.record([magnet_row('a1', 'A', 'combined', '2023-01-02T00:00:00')])
+    assert state.watermarks('11072') == {'A': '2023-01-02T00:00:00'}
+    state.close()
+
+    state = PullState(tmp_path / 'state.db')
+    assert state.watermarks('11072') == {'A': '2023-01-02T00:00:00'}
+    state.reset(['11072'])
+    assert state.watermarks('11072') == {} and len(state.emitted('11072')) == 0
+    state.close()
+
+
+def test_state_written_before_test_sn_was_kept_is_upgraded(tmp_path):
+    import sqlite3
+    con = sqlite3.connect(tmp_path / 'state.db')
+    con.execute('CREATE TABLE emitted (sxid TEXT NOT NULL, test_id TEXT NOT NULL, magnet_type TEXT, date TEXT NOT NULL, PRIMARY KEY (sxid, test_id))')
+    con.execute("INSERT INTO emitted VALUES ('11072', 'a1', 'combined', '2023-01-01T00:00:00')")
+    con.commit()
+    con.close()
+
+    state = PullState(tmp_path / 'state.db')
+    assert state.emitted('11072')['test_sn'].isna().all()
+    assert state.newest_emitted('11072', ['A']) == {}
+    state.close()
+
+
+def test_incremental_pull_uses_watermarks_and_keeps_newer_tests_of_present_magnets(tmp_path, monkeypatch):
+    state = PullState(tmp_path / 'state.db')
+    state.see('11072', {'A': '2023-03-01T00:00:00', 'B': '2023-02-01T00:00:00'})
+    state.record([magnet_row('a1', 'A', 'combined', '2023-03-01T00:00:00'), magnet_row('b1', 'B', 'inner', '2023-02-01T00:00:00')])
+
+    def pull_satellite(engine, sat, magnets_tree=None, since=None, latest_only=True, seen=None, cleaned=False):
+        assert since == {'A': '2023-03-01T00:00:00', 'B': '2023-02-01T00:00:00'}
+        seen.update({'A': '2023-04-01T00:00:00', 'B': None, 'C': '2023-01-15T00:00:00'})
+        return [magnet_row('a2', 'A', 'combined', '2023-04-01T00:00:00'), # newer test of a magnet
+                magnet_row('c1', 'C', 'inner', '2023-01-15T00:00:00'),    # older than the inner test of B, which is still in the satellite
+                magnet_row('c2', 'C', 'outer', '2023-01-10T00:00:00')]    # first test of a new magnet type
+    monkeypatch.setattr(mtp, 'pull_satellite', pull_satellite)
+
+    rows, summary = mtp.pull_satellite_summary(None, '11072', pd.DataFrame(), state)
+    assert summary['error'] is None
+    assert [row['test_id'] for row in rows] == ['a2', 'c2']
+    state.record(rows)
+    assert state.watermarks('11072') == {'A': '2023-04-01T00:00:00', 'B': '2023-02-01T00:00:00', 'C': '2023-01-15T00:00:00'}
+    state.close()
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analyze_sum_curve as asc
+import otto_tests
+import result_store as rs
+import sum_curve as sc
+from fake_otto_server import magnet_document
+
+
+# magnet test rows shaped like the pull output: a radial, inner and outer scan per satellite
+def magnet_rows(sxids, day=1):
+    rows = []
+    for sxid in sxids:
+        for i, kind in enumerate(['Radial', 'inner', 'outer']):
+            case_id = f'{sxid}-{day:02d}{i}'
+            document = magnet_document(case_id, f'{sxid}{i}', kind, f'2023-01-{day:02d}T08:00:00', seed=int(sxid) * 10 + i + day)
+            rows.append(otto_tests.generate_magnet_test_entry(otto_tests.Result(case_id, document), sxid))
+    return rows
+
+
+def stored(path, **kwargs):
+    return rs.read_results(path, **kwargs).sort_values(['sxid', 'magnet_type', 'test_id']).reset_index(drop=True)
+
+
+def test_write_results_round_trip(tmp_path):
+    path = tmp_path / 'store'
+    rows = magnet_rows(['11072', '11075'])
+    rs.write_results(rows, path)
+
+    df = stored(path)
+    expected = pd.DataFrame(rows).sort_values(['sxid', 'magnet_type', 'test_id']).reset_index(drop=True)
+    assert df['test_id'].tolist() == expected['test_id'].tolist()
+    np.testing.assert_allclose(np.stack(df['flux']), expected[rs.FLUX_COLUMNS].to_numpy())
+    np.testing.assert_allclose(df[rs.METRIC_COLUMNS].to_numpy(), expected[rs.METRIC_COLUMNS].to_numpy())
+
+    table = rs.read_table(path, sxids=['11075'], magnet_types=['inner'], columns=['sxid', 'test_id', 'flux'])
+    assert table.column_names == ['sxid', 'test_id', 'flux'] and table['test_id'].to_pylist() == ['11075-011']
+    np.testing.assert_allclose(rs.flux_matrix(table)[0], expected.loc[expected['test_id'] == '11075-011', rs.FLUX_COLUMNS].to_numpy()[0])
+
+
+@pytest.mark.parametrize('replace_partitions', [True, False])
+def test_write_results_replaces_partitions_or_only_their_tests(tmp_path, replace_partitions):
+    path = tmp_path / 'store'
+    rs.write_results(magnet_rows(['11072', '11075']), path)
+    newer = [row for row in magnet_rows(['11072'], day=2) if row['magnet_type'] == 'combined']
+    again = [row for row in magnet_rows(['11072']) if row['magnet_type'] == 'inner']
+    rs.write_results(newer + again, path, replace_partitions=replace_partitions)
+
+    df = stored(path, sxids=['11072'])
+    combined = df.loc[df['magnet_type'] == 'combined', 'test_id'].tolist()
+    assert combined == (['11072-020'] if replace_partitions else ['11072-010', '11072-020'])
+    assert df.loc[df['magnet_type'] == 'inner', 'test_id'].tolist() == ['11072-011'] # the same test is not stored twice
+    assert df.loc[df['magnet_type'] == 'outer', 'test_id'].tolist() == ['11072-012'] # partitions not written are kept
+    assert len(stored(path, sxids=['11075'])) == 3
+
+
+def test_analysis_reads_the_same_scans_from_the_store(tmp_path):
+    rows = magnet_rows(['11072', '11075', '11080'])
+    pd.DataFrame(rows).to_csv(tmp_path / 'tests.csv', index=False)
+    rs.write_results(rows, tmp_path / 'store')
+    pd.DataFrame({'sxid': [11075], 'mode_shifters': ['y']}).to_csv(tmp_path / 'classified.csv', index=False)
+
+    from_csv = sc.fleet_matrices(pd.read_csv(tmp_path / 'tests.csv'))
+    from_store = sc.store_matrices(tmp_path / 'store')
+    order = [list(from_store[0]).index(sat) for sat in from_csv[0]]
+    assert list(from_store[0][order]) == list(from_csv[0])
+    for csv_matrix, store_matrix in zip(from_csv[1:], from_store[1:]):
+        np.testing.assert_allclose(store_matrix[order], csv_matrix)
+
+    csv_metrics = asc.main(tmp_path / 'tests.csv', tmp_path / 'classified.csv', tmp_path / 'csv_out.csv')
+    store_metrics = asc.main(None, tmp_path / 'classified.csv', tmp_path / 'store_out.csv', store_path=tmp_path / 'store')
+    store_metrics = store_metrics.set_index('sxid').loc[csv_metrics['sxid']].reset_index()
+    assert store_metrics['mode_shifter'].tolist() == csv_metrics['mode_shifter'].tolist() == ['n', 'y', 'n']
+    pd.testing.assert_series_equal(store_metrics['sum_min'], csv_metrics['sum_min'])
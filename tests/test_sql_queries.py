@@ -0,0 +1,110 @@
+import pandas as pd
+import pytest
+
+import SQL_queries as sq
+import instrumentation as instr
+import magnet_test_pull as mtp
+
+
+def sorted_table(df):
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('chunksize', [None, 7])
+def test_batched_trees_match_one_query_per_satellite(erp, chunksize):
+    sats = ['11072', '11075', '11080']
+    batched = sq.get_full_magnets_trees(erp.engine, sats, tables=erp.tables, chunksize=chunksize)
+    if chunksize is not None:
+        batched = pd.concat(list(batched), ignore_index=True)
+
+    assert set(batched['RootSN']) == set(sats)
+    for sat in sats:
+        single = sq.get_full_magnets_tree(erp.engine, sat, tables=erp.tables)
+        assert len(single) > 0
+        tree = batched[batched['RootSN'] == sat].drop(columns='RootSN')
+        pd.testing.assert_frame_equal(sorted_table(tree), sorted_table(single), check_dtype=False)
+
+
+def test_batched_trees_chunks_of_sxids(erp):
+    sats = ['11072', '11075', '11080']
+    whole = sq.get_full_magnets_trees(erp.engine, sats, tables=erp.tables)
+    split = sq.get_full_magnets_trees(erp.engine, sats, chunk_size=2, tables=erp.tables)
+    pd.testing.assert_frame_equal(sorted_table(split), sorted_table(whole))
+
+
+def test_query_trees_split_by_satellite(erp):
+    trees = mtp.query_trees(erp.engine, ['11072', '11075', '99999'], tables=erp.tables)
+    assert set(trees) == {'11072', '11075'}
+    assert 'RootSN' not in trees['11072'].columns
+
+
+@pytest.mark.parametrize('chunksize', [None, 7])
+def test_pull_satellites_reports_empty_result_per_satellite(erp, chunksize):
+    rows, summary = mtp.pull_satellites(erp.engine, ['99998', '99999'], max_workers=2, chunksize=chunksize, tables=erp.tables)
+    assert rows == []
+    assert summary['sxid'].tolist() == ['99998', '99999']
+    assert summary['error'].str.contains('no genealogy rows').all()
+
+
+def test_pull_satellites_reports_query_failure_per_satellite(erp):
+    tables = {**erp.tables, 'Trace': 'MissingTrace'}
+    rows, summary = mtp.pull_satellites(erp.engine, ['11072', '11075'], max_workers=2, tables=tables)
+    assert rows == []
+    assert summary['sxid'].tolist() == ['11072', '11075']
+    assert summary['error'].str.contains('MissingTrace').all()
+
+
+@pytest.mark.parametrize('chunksize', [None, 7])
+def test_query_trees_reports_sql_rows_per_satellite(erp, chunksize):
+    sats = ['11072', '11075', '11080']
+    with instr.RunReport() as report:
+        mtp.query_trees(erp.engine, sats, chunksize, erp.tables)
+    records = report.to_frame()
+
+    sql = records[records['stage'] == 'sql'].set_index('sxid')
+    batched = sq.get_full_magnets_trees(erp.engine, sats, tables=erp.tables)
+    assert sql['sql_rows'].to_dict() == batched['RootSN'].value_counts().to_dict()
+    assert (sql['error'].isna()).all()
+    status = records[records['stage'] == 'status']
+    if chunksize is not None: # the streamed chunks are cleaned as they arrive, timed apart from the query
+        assert sorted(status['sxid']) == sats
+        assert (status['sql_rows'] == 0).all()
+    else:
+        assert len(status) == 0
+
+
+def test_query_trees_reports_failure_without_satellite(erp):
+    tables = {**erp.tables, 'Trace': 'MissingTrace'}
+    with instr.RunReport() as report:
+        with pytest.raises(Exception):
+            mtp.query_trees(erp.engine, ['11072'], 7, tables)
+    records = report.to_frame()
+    assert records[['sxid', 'stage']].values.tolist() == [[None, 'sql']]
+    assert records['error'].notna().all()
+
+
+# pull the satellites without fetching their tests, returning the run report and the info table of each satellite
+def pull_info_tables(erp, monkeypatch, sats, chunksize):
+    tables = {}
+
+    def full_table_to_test_entries(table, sat, *args):
+        tables[sat] = table.reset_index(drop=True)
+        return []
+    monkeypatch.setattr(mtp.ot, 'full_table_to_test_entries', full_table_to_test_entries)
+
+    with instr.RunReport() as report:
+        _, summary = mtp.pull_satellites(erp.engine, sats, max_workers=2, chunksize=chunksize, tables=erp.tables)
+    assert summary['error'].isna().all()
+    return report, tables
+
+
+def test_pull_satellites_cleans_statuses_once_per_satellite(erp, monkeypatch):
+    sats = ['11072', '11075', '11080']
+    streamed_report, streamed = pull_info_tables(erp, monkeypatch, sats, chunksize=7)
+    report, tables = pull_info_tables(erp, monkeypatch, sats, chunksize=None)
+
+    for run in [streamed_report, report]:
+        records = run.to_frame()
+        assert sorted(records.loc[records['stage'] == 'status', 'sxid']) == sats
+    for sat in sats: # the streamed trees, cleaned once by query_trees, give the same tables
+        pd.testing.assert_frame_equal(streamed[sat], tables[sat], check_dtype=False)